@@ -0,0 +1,78 @@
+# In-process memoisation of getters
+import copy
+import functools
+import os
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Files a getter reads: a list, or a function of the getter's arguments
+Paths = Union[Iterable[str], Callable[..., Iterable[str]]]
+
+
+def file_state(path: str) -> Tuple[str, Optional[int], Optional[int]]:
+    """Path, mtime (ns) and size of a file (None if it doesn't exist)"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return str(path), None, None
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def _copy(result: Any) -> Any:
+    # Deep, so that callers modifying values in place don't change the cache
+    if isinstance(result, (pd.DataFrame, pd.Series, np.ndarray)):
+        return result.copy()
+    return copy.deepcopy(result)
+
+
+def memoise(paths: Paths, maxsize: int = 4, copy_results: bool = True):
+    """Memoise a getter per set of arguments until the files it reads change
+
+    Results are kept in memory and returned again (as copies, so that callers
+    can modify them) while the mtime and size of `paths` are unchanged.
+    Memoise functions that load whole tables, so that each version of a file
+    is only held once, and read projections of them (which are cheaper to
+    read than to copy) from disk.
+
+    Args:
+        paths: files the getter reads, or a function that takes the getter's
+            arguments and returns them
+        maxsize: number of argument sets to keep results for. Keep it small
+            for large tables
+        copy_results: whether to return copies. Turn off for read-only results
+    """
+
+    def decorator(getter: Callable) -> Callable:
+        results = OrderedDict()
+        lock = Lock()
+
+        @functools.wraps(getter)
+        def wrapper(*args, **kwargs):
+            key = repr((args, sorted(kwargs.items())))
+            files = paths(*args, **kwargs) if callable(paths) else paths
+            # Checked before reading so that changes made during a read are
+            # picked up next time
+            state = tuple(file_state(path) for path in files)
+
+            with lock:
+                cached = results.get(key)
+                if cached is not None and cached[0] == state:
+                    results.move_to_end(key)
+                    return _copy(cached[1]) if copy_results else cached[1]
+
+            result = getter(*args, **kwargs)
+            with lock:
+                results[key] = (state, result)
+                results.move_to_end(key)
+                while len(results) > maxsize:
+                    results.popitem(last=False)
+            return _copy(result) if copy_results else result
+
+        wrapper.cache_clear = results.clear
+        return wrapper
+
+    return decorator
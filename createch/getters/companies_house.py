@@ -1,46 +1,199 @@
 import logging
-from functools import lru_cache
+import os
+from typing import List, Optional
 
 import pandas as pd
-from metaflow import namespace, Run
 
 import createch
+from createch.getters.daps import Filters, filter_columns, filters_on, select_table
+from createch.getters.cache import memoise
+from createch.getters.metaflow_mirror import get_artifact, mirror_path
+from createch.utils.io import atomic_write
 
 logger = logging.getLogger(__name__)
-namespace(None)
 
 
+FLOW_NAME: str = "CompaniesHouseMergeDumpFlow"
 RUN_ID: int = createch.config["flows"]["companies_house"]["run_id"]
 
 
-@lru_cache()
-def _flow(run_id: int) -> Run:
-    return Run(f"CompaniesHouseMergeDumpFlow/{run_id}")
+def _artifact(
+    name: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    return get_artifact(FLOW_NAME, RUN_ID, name, columns=columns, filters=filters)
 
 
-def get_organisation() -> pd.DataFrame:
-    return _flow(RUN_ID).data.organisation
+def get_organisation(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    return _artifact("organisation", columns, filters)
 
 
-def get_address() -> pd.DataFrame:
-    return (
-        _flow(RUN_ID)
-        .data.organisationaddress.drop_duplicates(["company_number", "address_id"])
-        .merge(_flow(RUN_ID).data.address, on="address_id")
+def get_address(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """Returns the addresses of companies (see `daps.select_table` for the
+    arguments).
+
+    Filters on address columns are applied as addresses are read. Companies
+    are filtered after the join, since filtering the links first would change
+    the order the join returns addresses in.
+    """
+    # Columns other than company numbers come from `address`
+    address_filter_cols = [
+        col for col in filter_columns(filters) if col != "company_number"
+    ]
+    address_columns = None
+    if columns is not None:
+        needed = ["address_id"] + columns + filter_columns(filters)
+        address_columns = [col for col in needed if col != "company_number"]
+        address_columns = list(dict.fromkeys(address_columns))
+
+    address = (
+        _artifact("organisationaddress", ["company_number", "address_id"])
+        .drop_duplicates(["company_number", "address_id"])
+        .merge(
+            _artifact(
+                "address", address_columns, filters_on(filters, address_filter_cols)
+            ),
+            on="address_id",
+        )
     )
+    return select_table(address, columns, filters)
+
+
+# Columns of `organisationsector` that the columns of `get_sector` come from
+SECTOR_SOURCES = {
+    "SIC5_code": "sector_id",
+    "SIC4_code": "sector_id",
+    "data_dump_date": "date",
+}
 
 
-def get_sector() -> pd.DataFrame:
-    """Returns most up-to-date sector rankings."""
-    return (
-        _flow(RUN_ID)
-        .data.organisationsector.sort_values("date")
+def get_sector(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """Returns most up-to-date sector rankings.
+
+    Rankings are de-duplicated by company and rank, so only filters on those
+    are applied as the artifact is read.
+    """
+    sector_columns = None
+    if columns is not None:
+        needed = columns + filter_columns(filters)
+        sector_columns = ["company_number", "rank", "date", "sector_id"] + [
+            SECTOR_SOURCES.get(col, col) for col in needed
+        ]
+        sector_columns = list(dict.fromkeys(sector_columns))
+
+    sector = (
+        _artifact(
+            "organisationsector",
+            sector_columns,
+            filters_on(filters, ["company_number", "rank"]),
+        )
+        .sort_values("date", kind="mergesort")
         .drop_duplicates(["company_number", "rank"], keep="last")
         .assign(SIC4_code=lambda x: x.sector_id.str.slice(0, 4))
         .rename(columns={"date": "data_dump_date", "sector_id": "SIC5_code"})
     )
+    return select_table(sector, columns, filters)
 
 
-def get_name() -> pd.DataFrame:
+def get_name(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
     """Returns companies house organisation name data."""
-    return _flow(RUN_ID).data.organisationname
+    return _artifact("organisationname", columns, filters)
+
+
+def view_path(name: str) -> str:
+    return mirror_path(FLOW_NAME, RUN_ID, f"views/{name}")
+
+
+def make_latest_sector() -> pd.DataFrame:
+    """Most up-to-date first-ranked sector of each company"""
+    return get_sector(
+        ["company_number", "SIC5_code", "SIC4_code", "data_dump_date"],
+        [("rank", "==", 1)],
+    )
+
+
+def make_company_postcodes() -> pd.DataFrame:
+    """Postcode of each address of each company"""
+    return get_address(["company_number", "postcode"])
+
+
+# Tables derived from the run, keyed (and sorted) by company number
+VIEWS = {
+    "latest_sector": make_latest_sector,
+    "company_postcodes": make_company_postcodes,
+}
+
+
+def refresh_view(name: str) -> str:
+    """Build a view and save it sorted by `company_number`, so that reads
+    filtered on company numbers can skip row groups (the sort is stable, so
+    rows of a company keep the order they had in the run)
+    Args:
+        name: name of the view (one of `VIEWS`)
+    Returns:
+        path of the view
+    """
+    logging.info(f"Building {name} view of {FLOW_NAME}/{RUN_ID}")
+    view = VIEWS[name]().sort_values("company_number", kind="mergesort")
+
+    path = view_path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as tmp_path:
+        view.to_parquet(tmp_path, index=False, row_group_size=100_000)
+    return path
+
+
+def refresh_views():
+    """Rebuild all views (e.g. after mirroring a new run)"""
+    for name in VIEWS:
+        refresh_view(name)
+
+
+def _view_paths(name: str, *args, **kwargs):
+    return [view_path(name)]
+
+
+def _built_view_path(name: str) -> str:
+    path = view_path(name)
+    if not os.path.exists(path):
+        refresh_view(name)
+    return path
+
+
+@memoise(_view_paths, maxsize=2)
+def _load_view(name: str) -> pd.DataFrame:
+    return pd.read_parquet(_built_view_path(name))
+
+
+def get_view(
+    name: str, columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """Read a view, building it if needed. Whole views are kept in memory
+    until they change (see `cache.memoise`)
+    """
+    if columns is None and filters is None:
+        return _load_view(name)
+    return pd.read_parquet(_built_view_path(name), columns=columns, filters=filters)
+
+
+def get_latest_sector(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """Returns the most up-to-date first-ranked sector of each company."""
+    return get_view("latest_sector", columns, filters)
+
+
+def get_company_postcodes(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """Returns the postcode of each address of each company."""
+    return get_view("company_postcodes", columns, filters)
@@ -1,39 +1,51 @@
 import json
 import logging
 from functools import lru_cache
-from typing import Dict
+from typing import Dict, List, Optional
 
 import pandas as pd
 from metaflow import namespace, Run
 
 import createch
 from createch import PROJECT_DIR
-from createch.getters.daps import fetch_daps_table, save_daps_table
-from createch.getters.gtr import get_cis_lookup
+from createch.getters.cache import memoise
+from createch.getters.daps import (
+    fetch_daps_table,
+    Filters,
+    get_csv,
+    get_daps_table,
+    select_table,
+    table_paths,
+)
+from createch.getters.gtr import get_cis_lookup, SIC_LOOKUP_PATH
+from createch.getters.processing import get_tokenised
+from createch.getters.token_store import TokenStore
 from createch.pipeline.fetch_daps1_data.cb_utils import CB_PATH
+from createch.utils.io import LookupStore, open_lookup
 
 logger = logging.getLogger(__name__)
 namespace(None)
 
 RUN_ID: int = createch.config["flows"]["nesta"]["run_id"]
 
+CB_CH_PATH = f"{PROJECT_DIR}/inputs/data/crunchbase/crunchbase_ch_organisations.csv"
 
-def get_crunchbase_orgs():
-    return pd.read_csv(f"{CB_PATH}/crunchbase_organisations.csv")
 
+def get_crunchbase_orgs(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """UK Crunchbase organisations (see `get_daps_table` for the arguments)"""
+    return get_daps_table("crunchbase_organisations", CB_PATH, columns, filters)
 
-def get_crunchbase_tokenised():
-    with open(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/crunchbase_tokenised.json", "r"
-    ) as infile:
-        return json.load(infile)
 
+def get_crunchbase_tokenised() -> TokenStore:
+    """Memory-mapped lookup between ids and tokenised descriptions"""
+    return get_tokenised("crunchbase_tokenised")
 
-def get_crunchbase_tagged():
-    with open(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/crunchbase_area_tagged.json", "r"
-    ) as infile:
-        return json.load(infile)
+
+def get_crunchbase_tagged() -> LookupStore:
+    """Key-value store of the areas tagged in each organisation"""
+    return open_lookup("outputs/data/crunchbase/crunchbase_area_tagged")
 
 
 def get_crunchbase_vocabulary():
@@ -42,99 +54,51 @@ def get_crunchbase_vocabulary():
     ) as infile:
         return json.load(infile)
 
-def get_crunchbase_orgs_cats_uk():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/crunchbase/crunchbase_organizations_categories.csv"
-    )
-
-
-def get_crunchbase_orgs_cats_all():
-
-    return fetch_daps_table("crunchbase_organizations_categories")
-
-
-def get_crunchbase_topics():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/crunchbase_topic_mix.csv", index_col=0
-    )
-
-
-def get_crunchbase_industry_pred():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/predicted_industries.csv"
-    )
-
-
-def get_cb_ch_organisations(creative=True):
-
-    SIC_IND_LOOKUP = get_cis_lookup()
-
-    uk_orgs = set(get_crunchbase_orgs()["id"])
-
-    cb_ch = pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/crunchbase/crunchbase_ch_organisations.csv",
-        dtype={"SIC4_code": str},
-    )
-
-    cb_ch = (
-        cb_ch.loc[cb_ch["cb_id"].isin(uk_orgs)][
-            [
-                "cb_id",
-                "sim_mean",
-                "cb_name",
-                "company_number",
-                "ch_name",
-                "SIC4_code",
-                "ttwa_code",
-                "ttwa_name",
-            ]
-        ]
-        .drop_duplicates(subset=["cb_id"])
-        .assign(creative_sector=lambda df: df["SIC4_code"].map(SIC_IND_LOOKUP))
-    )
-
-    if creative is True:
-        cb_ch = cb_ch.dropna(axis=0, subset=["creative_sector"]).reset_index(drop=True)
 
-    else:
-        cb_ch = cb_ch.fillna(value={"creative_sector": "other"})
-
-    return cb_ch
-
-
-def get_crunchbase_orgs_cats_uk():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/crunchbase/crunchbase_organizations_categories.csv"
+def get_crunchbase_orgs_cats_uk(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    return get_daps_table(
+        "crunchbase_organizations_categories", CB_PATH, columns, filters
     )
 
 
-def get_crunchbase_orgs_cats_all():
+def get_crunchbase_orgs_cats_all(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
 
-    return fetch_daps_table("crunchbase_organizations_categories")
+    fields = "all" if columns is None or filters else columns
+    cats = fetch_daps_table("crunchbase_organizations_categories", fields)
+    return select_table(cats, columns, filters)
 
 
-def get_crunchbase_topics():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/crunchbase_topic_mix.csv", index_col=0
+def get_crunchbase_topics(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
+        f"{PROJECT_DIR}/outputs/data/crunchbase/crunchbase_topic_mix.csv",
+        columns,
+        filters,
+        index_col=0,
     )
 
 
-def get_crunchbase_industry_pred():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/crunchbase/predicted_industries.csv"
+def get_crunchbase_industry_pred(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
+        f"{PROJECT_DIR}/outputs/data/crunchbase/predicted_industries.csv",
+        columns,
+        filters,
     )
 
 
-def get_cb_ch_organisations(creative=True):
+@memoise(
+    [SIC_LOOKUP_PATH, CB_CH_PATH, *table_paths("crunchbase_organisations", CB_PATH)]
+)
+def _get_cb_ch_organisations(creative: bool) -> pd.DataFrame:
 
     SIC_IND_LOOKUP = get_cis_lookup()
 
-    uk_orgs = set(get_crunchbase_orgs()["id"])
+    uk_orgs = set(get_crunchbase_orgs(columns=["id"])["id"])
 
-    cb_ch = pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/crunchbase/crunchbase_ch_organisations.csv",
-        dtype={"SIC4_code": str},
-    )
+    cb_ch = pd.read_csv(CB_CH_PATH, dtype={"SIC4_code": str})
 
     cb_ch = (
         cb_ch.loc[cb_ch["cb_id"].isin(uk_orgs)][
@@ -162,42 +126,14 @@ def get_cb_ch_organisations(creative=True):
     return cb_ch
 
 
-def filter_uk(table: pd.DataFrame, ids: set, var_name: str = "org_id"):
-    """Gets UK companies from crunchbase
-    Args:
-        table: crunchbase table
-        ids: UK company ids
-        var_name: name of org id variable
-    Returns:
-        filtered table
-    """
-    return table.loc[table[var_name].isin(ids)].reset_index(drop=True)
-
-
-def fetch_save_crunchbase():
-    """Fetch and save crunchbase data"""
-    cb_orgs = fetch_daps_table("crunchbase_organizations", fields="all")
-
-    cb_uk = cb_orgs.loc[cb_orgs["country"] == "United Kingdom"].drop_duplicates(
-        subset=["id"]
-    )
-    logging.info(len(cb_uk))
-    save_daps_table(cb_uk, "crunchbase_organisations", CB_PATH)
-
-    cb_uk_ids = set(cb_uk["id"])
-
-    cb_funding_rounds = fetch_daps_table("crunchbase_funding_rounds", fields="all")
-    cb_funding_rounds_uk = filter_uk(cb_funding_rounds, cb_uk_ids)
-
-    cb_orgs_cats = fetch_daps_table("crunchbase_organizations_categories", fields="all")
-    cb_org_cats_uk = filter_uk(cb_orgs_cats, cb_uk_ids, "organization_id")
+def get_cb_ch_organisations(
+    creative=True,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    return select_table(_get_cb_ch_organisations(creative), columns, filters)
 
-    category_group = fetch_daps_table("crunchbase_category_groups", fields="all")
 
-    save_daps_table(cb_funding_rounds_uk, "crunchbase_funding_rounds", CB_PATH)
-    save_daps_table(cb_org_cats_uk, "crunchbase_organizations_categories", CB_PATH)
-    save_daps_table(category_group, "crunchbase_category_groups", CB_PATH)
-    
 @lru_cache()
 def _flow(run_id: int) -> Run:
     return Run(f"CreatechNestaGetter/{run_id}")
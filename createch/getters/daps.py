@@ -1,11 +1,336 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, List, Optional, Tuple
+
 import pandas as pd
 
+from createch import config, PROJECT_DIR
+from createch.getters import store
+from createch.getters.cache import memoise
+from createch.pipeline.fetch_daps1_data import daps1_utils
+from createch.pipeline.fetch_daps1_data.schemas import apply_schema, get_csv_dtypes
+from createch.utils.io import atomic_write
+
+CACHE_DIR = f"{PROJECT_DIR}/outputs/.cache/daps"
+CACHE_CONFIG = config["daps_cache"]
+
+# Row filters in DNF, as used by `pyarrow.parquet`: a list of
+# `(column, op, value)` tuples (AND) or a list of such lists (OR)
+Filters = List[Any]
+
+FILTER_OPS = {
+    "==": lambda col, val: col == val,
+    "=": lambda col, val: col == val,
+    "!=": lambda col, val: col != val,
+    "<": lambda col, val: col < val,
+    "<=": lambda col, val: col <= val,
+    ">": lambda col, val: col > val,
+    ">=": lambda col, val: col >= val,
+    "in": lambda col, val: col.isin(val),
+    "not in": lambda col, val: ~col.isin(val),
+}
+
+
+def _as_dnf(filters: Optional[Filters]) -> List[List[Tuple[str, str, Any]]]:
+    """Normalise filters to a list of conjunctions"""
+    if not filters:
+        return []
+    return [filters] if isinstance(filters[0], tuple) else filters
+
+
+def apply_filters(
+    table: pd.DataFrame, filters: Optional[Filters], reset_index: bool = True
+) -> pd.DataFrame:
+    """Apply `pyarrow.parquet`-style row filters to a DataFrame
+    Args:
+        table: table to filter
+        filters: list of `(column, op, value)` tuples, or a list of such lists
+        reset_index: whether to reset the index of the filtered table
+    Returns:
+        filtered table
+    """
+    if not filters:
+        return table
+
+    mask = pd.Series(False, index=table.index)
+    for conjunction in _as_dnf(filters):
+        conj_mask = pd.Series(True, index=table.index)
+        for column, op, value in conjunction:
+            conj_mask &= FILTER_OPS[op](table[column], value)
+        mask |= conj_mask
+
+    table = table.loc[mask]
+    return table.reset_index(drop=True) if reset_index else table
+
+
+def filter_columns(filters: Optional[Filters]) -> List[str]:
+    """Columns used by row filters (see `apply_filters`)"""
+    columns = [column for conj in _as_dnf(filters) for column, _, _ in conj]
+    return list(dict.fromkeys(columns))
+
+
+def rename_filters(filters: Optional[Filters], names: dict) -> Optional[Filters]:
+    """Row filters (see `apply_filters`) with their columns renamed"""
+    if not filters:
+        return filters
+    return [
+        [(names.get(col, col), op, val) for col, op, val in conj]
+        for conj in _as_dnf(filters)
+    ]
+
 
-def get_daps_table(name: str, path: str) -> pd.DataFrame:
+def filters_on(filters: Optional[Filters], columns: List[str]) -> Optional[Filters]:
+    """Weaker filters using only some columns, e.g. to filter a table before
+    it is joined or derived from (rows they drop would be dropped by
+    `filters` too)
+    Args:
+        filters: row filters (see `apply_filters`)
+        columns: columns the weaker filters can use
+    Returns:
+        the predicates of each conjunction on `columns`, or None if a
+        conjunction has none (then no rows can be dropped)
+    """
+    conjunctions = [
+        [(col, op, val) for col, op, val in conj if col in columns]
+        for conj in _as_dnf(filters)
+    ]
+    if len(conjunctions) == 0 or any(len(conj) == 0 for conj in conjunctions):
+        return None
+    return conjunctions
+
+
+def select_table(
+    table: pd.DataFrame,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    reset_index: bool = True,
+) -> pd.DataFrame:
+    """Select columns and rows (see `apply_filters`) of an in-memory table"""
+    table = apply_filters(table, filters, reset_index)
+    return table if columns is None else table[columns]
+
+
+def read_csv(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """Read a csv, only parsing the columns we need
+    Args:
+        path: csv file (optionally compressed with gzip or zstd)
+        columns: columns to read. If None, reads all of them
+        filters: row filters (see `apply_filters`)
+        kwargs: passed to `pd.read_csv`, e.g. `dtype` or `index_col`
+    Returns:
+        table
+    """
+    if columns is not None:
+        usecols = list(dict.fromkeys(columns + filter_columns(filters)))
+        if isinstance(kwargs.get("index_col"), int):
+            with daps1_utils.csv_source(path) as source:
+                header = pd.read_csv(source, nrows=0).columns
+            usecols.insert(0, header[kwargs["index_col"]])
+        kwargs["usecols"] = usecols
+
+    with daps1_utils.csv_source(path) as source:
+        table = pd.read_csv(source, **kwargs)
+
+    table = apply_filters(table, filters, reset_index=kwargs.get("index_col") is None)
+    return table if columns is None else table[columns]
+
+
+def _csv_paths(path: str, **kwargs) -> List[str]:
+    return [path]
+
+
+@memoise(_csv_paths, maxsize=8)
+def _load_csv(path: str, **kwargs) -> pd.DataFrame:
+    return read_csv(path, **kwargs)
+
+
+def get_csv(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    **kwargs,
+) -> pd.DataFrame:
+    """Read a csv (see `read_csv`). Whole csvs are kept in memory until they
+    change (see `cache.memoise`)
+    """
+    if columns is None and filters is None:
+        return _load_csv(path, **kwargs)
+    return read_csv(path, columns, filters, **kwargs)
+
+
+def _read_parquet(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    dtype: Optional[dict] = None,
+) -> pd.DataFrame:
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+def _read_csv(
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    dtype: Optional[dict] = None,
+) -> pd.DataFrame:
+    return read_csv(path, columns, filters, dtype=dtype)
+
+
+# Readers for each storage format (see `daps1_utils.stored_format` for the
+# copy that is read)
+READERS = {
+    "parquet": _read_parquet,
+    "csv.zst": _read_csv,
+    "csv.gz": _read_csv,
+    "csv": _read_csv,
+}
+
+
+def table_paths(name: str, path: str, *args, **kwargs) -> List[str]:
+    """Paths a DAPS table can be stored at (one per format)"""
+    return [f"{path}/{name}.{fmt}" for fmt in READERS]
+
+
+def _read_daps_table(
+    name: str,
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    fmt = daps1_utils.stored_format(name, path)
+    if fmt is None:
+        raise FileNotFoundError(f"No stored copy of {name} in {path}")
+
+    # Upsert syncs append new versions of rows, so only the last one of
+    # each key is kept (before rows are filtered)
+    meta = daps1_utils.get_sync_metadata(name, path)
+    key = meta.get("key") if meta is not None and meta.get("format") == fmt else None
+    table = READERS[fmt](
+        f"{path}/{name}.{fmt}",
+        columns=columns if key is None else None,
+        filters=filters if key is None else None,
+        dtype=get_csv_dtypes(name),
+    )
+    if key is not None:
+        table = table.drop_duplicates(key, keep="last")
+        table = select_table(table, columns, filters)
+    return apply_schema(table, name)
+
+
+def store_daps_table(name: str, path: str):
+    """Load a DAPS table into the analytical store if it isn't up to date"""
+    store.ensure_table(
+        name, lambda: _read_daps_table(name, path), table_paths(name, path)
+    )
+
+
+@memoise(table_paths, maxsize=8)
+def _load_daps_table(name: str, path: str) -> pd.DataFrame:
+    return _read_daps_table(name, path)
+
+
+def get_daps_table(
+    name: str,
+    path: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
     """Get DAPS table
     Args:
         name: table name
         path: storage path
+        columns: columns to read. If None, reads all of them
+        filters: row filters (see `apply_filters`)
+    Returns:
+        table, with the dtypes declared in `schemas.DTYPES`. Whole tables are
+        kept in memory until their file changes (see `cache.memoise`), while
+        only the columns and row groups needed are read for projections. If
+        the analytical store is enabled (see `store.use_store`), the table is
+        loaded into it once and read with a query instead
     """
-    table = pd.read_csv(f"{path}/{name}.csv")
+    if store.use_store():
+        store_daps_table(name, path)
+        return apply_schema(store.select(name, columns, filters), name)
+    if columns is None and filters is None:
+        return _load_daps_table(name, path)
+    return _read_daps_table(name, path, columns, filters)
+
+
+def cache_path(
+    table_name: str, fields: Any = "all", query: Optional[str] = None
+) -> str:
+    """Path DAPS query results are cached at by `fetch_daps_table`"""
+    key = json.dumps(
+        {"table": table_name, "fields": fields, "query": query}, sort_keys=True
+    )
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]  # noqa: S303
+    return f"{CACHE_DIR}/{table_name}-{digest}.parquet"
+
+
+def fetch_daps_table(
+    table_name: str,
+    fields: Any = "all",
+    query: Optional[str] = None,
+    ttl: Optional[int] = None,
+    offline: Optional[bool] = None,
+) -> pd.DataFrame:
+    """Fetch a DAPS table, caching it on disk
+
+    Results are cached in `CACHE_DIR` under a hash of the table, fields and
+    query, so repeated calls only hit the database once the cache expires.
+
+    Args:
+        table_name: name of the DAPS table
+        fields: fields to fetch. If a list, fetches those
+        query: SQL query to run instead of reading the whole table
+        ttl: seconds cached results are valid for. Defaults to
+            `daps_cache.ttl` in the base config
+        offline: if True, only read from the cache. Defaults to
+            `daps_cache.offline` in the base config or `CREATECH_OFFLINE`
+    Returns:
+        table
+
+    Raises:
+        FileNotFoundError if offline and the results are not cached
+    """
+    ttl = CACHE_CONFIG["ttl"] if ttl is None else ttl
+    if offline is None:
+        offline = CACHE_CONFIG["offline"] or bool(os.getenv("CREATECH_OFFLINE"))
+
+    path = cache_path(table_name, fields, query)
+    if os.path.exists(path):
+        if offline or time.time() - os.path.getmtime(path) < ttl:
+            return apply_schema(pd.read_parquet(path), table_name)
+    elif offline:
+        raise FileNotFoundError(f"{table_name} is not cached and we are offline")
+
+    logging.info(f"Fetching {table_name} from DAPS")
+    if query is None:
+        chunks = daps1_utils.fetch_daps_table(table_name, fields)
+    else:
+        chunks = daps1_utils.fetch_daps_query(query)
+    table = apply_schema(pd.concat(chunks).reset_index(drop=True), table_name)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Prefetching threads may read the cache while it is written
+    with atomic_write(path) as tmp_path:
+        table.to_parquet(tmp_path, index=False)
     return table
+
+
+def invalidate_daps_cache(table_name: Optional[str] = None):
+    """Remove cached DAPS tables
+    Args:
+        table_name: table whose cached results to remove. If None, removes all
+    """
+    for path in glob.glob(f"{CACHE_DIR}/{table_name or '*'}-*.parquet"):
+        os.remove(path)
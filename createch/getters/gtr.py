@@ -3,14 +3,32 @@ import json
 import logging
 import os
 from functools import lru_cache
-from typing import Dict
+from typing import Dict, List, Optional
 
 import pandas as pd
 from metaflow import namespace, Run
 
 import createch
 from createch import config, PROJECT_DIR
+from createch.getters import store
+from createch.getters.cache import memoise
+from createch.getters.daps import (
+    cache_path,
+    fetch_daps_table,
+    Filters,
+    get_csv,
+    get_daps_table,
+    select_table,
+    store_daps_table,
+    table_paths,
+)
+from createch.getters.link_store import build_link_store, LinkRelation
+from createch.getters.processing import get_tokenised
+from createch.getters.token_store import TokenStore
 from createch.pipeline.fetch_daps1_data.gtr_utils import GTR_PATH
+from createch.pipeline.fetch_daps1_data.schemas import apply_schema
+from createch.utils.io import LookupStore, open_lookup
+from createch.utils.text_match import has_terms, label_terms
 
 logger = logging.getLogger(__name__)
 
@@ -18,10 +36,18 @@ namespace(None)
 
 RUN_ID: int = createch.config["flows"]["nesta"]["run_id"]
 
+SIC_LOOKUP_PATH = f"{PROJECT_DIR}/inputs/data/sic_sector_lookup.csv"
+GTR_CH_PATH = f"{PROJECT_DIR}/inputs/data/gtr/gtr_ch_organisations.csv"
+LINK_STORE_PATH = f"{GTR_PATH}/link_store"
 
-def get_gtr_projects():
-    df = pd.read_csv(f"{GTR_PATH}/gtr_projects.csv")
-    df["start"] = pd.to_datetime(df["start"])
+
+def get_gtr_projects(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    """GtR projects (see `get_daps_table` for `columns` and `filters`)"""
+    df = get_daps_table("gtr_projects", GTR_PATH, columns, filters)
+    if "start" in df.columns:
+        df["start"] = pd.to_datetime(df["start"])
     return df
 
 
@@ -29,14 +55,14 @@ def get_gtr_predicted_disciplines():
     pd.read_csv(f"{PROJECT_DIR}/outputs/data/gtr/predicted_disciplines.csv")
 
 
-def get_gtr_tokenised():
-    with open(f"{PROJECT_DIR}/outputs/data/gtr/gtr_tokenised.json", "r") as infile:
-        return json.load(infile)
+def get_gtr_tokenised() -> TokenStore:
+    """Memory-mapped lookup between ids and tokenised descriptions"""
+    return get_tokenised("gtr_tokenised")
 
 
-def get_gtr_tagged():
-    with open(f"{PROJECT_DIR}/outputs/data/gtr/gtr_area_tagged.json", "r") as infile:
-        return json.load(infile)
+def get_gtr_tagged() -> LookupStore:
+    """Key-value store of the areas tagged in each project (see `open_lookup`)"""
+    return open_lookup("outputs/data/gtr/gtr_area_tagged")
 
 
 def get_gtr_vocabulary():
@@ -44,10 +70,9 @@ def get_gtr_vocabulary():
         return json.load(infile)
 
 
+@memoise([SIC_LOOKUP_PATH])
 def get_cis_lookup():
-    lookup = pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/sic_sector_lookup.csv", dtype={"SIC4_code": str}
-    )
+    lookup = pd.read_csv(SIC_LOOKUP_PATH, dtype={"SIC4_code": str})
     code_industry_lu = (
         lookup.query("industry != 'Life Sciences'")
         .set_index("SIC4_code")["industry"]
@@ -56,19 +81,58 @@ def get_cis_lookup():
     return code_industry_lu
 
 
-def get_link_table():
-    return pd.read_csv(f"{PROJECT_DIR}/inputs/data/gtr/gtr_link_table.csv")
+def get_link_table(
+    columns: Optional[List[str]] = None, filters: Optional[Filters] = None
+) -> pd.DataFrame:
+    return get_daps_table("gtr_link_table", GTR_PATH, columns, filters)
+
+
+def _link_relation_paths(table_name: str) -> List[str]:
+    return [f"{LINK_STORE_PATH}/{table_name}.npz"] + table_paths(
+        "gtr_link_table", GTR_PATH
+    )
+
+
+@memoise(_link_relation_paths, copy_results=False)
+def get_link_relation(table_name: str) -> LinkRelation:
+    """Indexed links between GtR projects and another table
+
+    The link store is (re)built from the link table if it is missing or
+    older than the link table.
+
+    Args:
+        table_name: linked table, e.g. "gtr_organisations", "gtr_funds" or
+            "gtr_topic"
+    Returns:
+        read-only links (see `link_store.LinkRelation`)
+    """
+    relation_path, *link_paths = _link_relation_paths(table_name)
+    link_mtime = max(
+        (os.path.getmtime(path) for path in link_paths if os.path.exists(path)),
+        default=0,
+    )
+    if os.path.exists(relation_path) is False:
+        build_link_store(get_link_table(), LINK_STORE_PATH)
+    elif link_mtime > os.path.getmtime(relation_path):
+        build_link_store(get_link_table(), LINK_STORE_PATH)
+    return LinkRelation.load(relation_path)
+
+
+ORGANISATION_PATHS = [
+    SIC_LOOKUP_PATH,
+    GTR_CH_PATH,
+    cache_path("gtr_organisations"),
+    cache_path("gtr_organisations_locations"),
+]
 
 
-def get_organisations(creative=True):
+@memoise(ORGANISATION_PATHS)
+def _get_organisations(creative: bool) -> pd.DataFrame:
 
     SIC_IND_LOOKUP = get_cis_lookup()
     FILTER_TERMS = config["gtr_organisations"]["filter_terms"]
 
-    orgs = pd.read_csv(
-        f"{PROJECT_DIR}/inputs/data/gtr/gtr_ch_organisations.csv",
-        dtype={"SIC4_code": str},
-    )
+    orgs = pd.read_csv(GTR_CH_PATH, dtype={"SIC4_code": str})
 
     orgs = orgs[
         [
@@ -82,9 +146,7 @@ def get_organisations(creative=True):
             "sim_mean",
         ]
     ].drop_duplicates("gtr_id")
-    orgs["flag"] = [
-        any(x in name.lower() for x in FILTER_TERMS) for name in orgs["gtr_name"]
-    ]
+    orgs["flag"] = has_terms(orgs["gtr_name"], FILTER_TERMS)
 
     orgs = orgs.query("flag==False").assign(
         creative_sector=lambda df: df["SIC4_code"].map(SIC_IND_LOOKUP)
@@ -101,90 +163,99 @@ def get_organisations(creative=True):
     return orgs_final
 
 
-def get_gtr_topics():
-    return pd.read_csv(f"{PROJECT_DIR}/outputs/data/gtr/gtr_topic_mix.csv", index_col=0)
-
-
-def get_gtr_disciplines():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/gtr/predicted_disciplines.csv", index_col=0
-    )
-
-
-def get_project_orgs_lookup():
-    link = get_link_table().query("table_name=='gtr_organisations'")
-
-    return link[["id", "project_id"]]
+def get_organisations(
+    creative=True,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    return select_table(_get_organisations(creative), columns, filters)
 
 
-def get_gtr_createch_tagged():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/gtr_createch_tagged.csv", index_col=0
-    )
+def _store_organisations(creative: bool) -> str:
+    """Load the organisations into the analytical store, returning their name"""
+    name = "gtr_organisations_creative" if creative else "gtr_organisations_all"
+    store.ensure_table(name, lambda: _get_organisations(creative), ORGANISATION_PATHS)
+    return name
 
 
-def get_gtr_orgs_tagged():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/gtr/gtr_createch_orgs.csv",
-        dtype={"SIC4_code": str},
-    )
+def get_project_organisations(
+    creative=True,
+    project_columns: Optional[List[str]] = None,
+    org_columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    """GtR projects joined to their (matched) organisations
 
+    The join runs inside the analytical store if it is enabled (see
+    `store.use_store`), so only the requested columns and rows are returned.
 
-def expand_gtr_orgs(orgs):
-    """Expands GTR organisations with other potentially relevant ones"""
-    gtr_addresses = fetch_daps_table("gtr_organisations_locations")
-    uk_orgs = set(
-        gtr_addresses.loc[gtr_addresses["country_name"] == "United Kingdom"]["id"]
+    Args:
+        creative: whether to only keep creative industries organisations
+        project_columns: project columns to return. If None, returns all
+        org_columns: organisation columns to return. If None, returns all
+        filters: row filters on the joined table (see `daps.apply_filters`)
+    Returns:
+        table with `project_id`, `gtr_id` and the requested columns
+    """
+    if not store.use_store():
+        links = get_link_relation("gtr_organisations").to_frame()
+        joined = (
+            links[["project_id", "id"]]
+            .rename(columns={"id": "gtr_id"})
+            .merge(
+                get_gtr_projects(project_columns and ["project_id"] + project_columns)
+            )
+            .merge(
+                get_organisations(creative, org_columns and ["gtr_id"] + org_columns)
+            )
+        )
+        return select_table(joined, filters=filters)
+
+    store_daps_table("gtr_projects", GTR_PATH)
+    store_daps_table("gtr_link_table", GTR_PATH)
+    orgs = _store_organisations(creative)
+
+    project_columns = project_columns or store.columns("gtr_projects")
+    org_columns = org_columns or store.columns(orgs)
+    fields = ["l.project_id", "l.id AS gtr_id"]
+    fields += [f'p."{col}"' for col in project_columns if col != "project_id"]
+    fields += [f'o."{col}"' for col in org_columns if col != "gtr_id"]
+    where, params = store.where_clause(filters)
+    joined = store.query(
+        f"""SELECT * FROM (
+            SELECT {", ".join(fields)}
+            FROM gtr_link_table l
+            JOIN gtr_projects p ON p.project_id = l.project_id
+            JOIN "{orgs}" o ON o.gtr_id = l.id
+            WHERE l.table_name = ?
+        ){where}""",
+        ["gtr_organisations"] + params,
     )
-
-    gtr_orgs = fetch_daps_table("gtr_organisations")
-    gtr_orgs_uk = gtr_orgs.loc[gtr_orgs["id"].isin(uk_orgs)].reset_index(drop=True)
-
-    relevant = ["museum", "library", "gallery", "broadcasting", "bbc"]
-    museum = ["museum", "library", "gallery"]
-
-    gtr_orgs_rel = gtr_orgs_uk.loc[
-        [any(r in name.lower() for r in relevant) for name in gtr_orgs_uk["name"]]
-    ]
-    gtr_orgs_rel = gtr_orgs_rel.loc[~gtr_orgs_rel["id"].isin(orgs["gtr_id"])]
-
-    gtr_orgs_rel["creative_sector"] = [
-        "Museums galleries and libraries"
-        if any(m in name.lower() for m in ["museum", "library", "gallery"])
-        else "Film TV video radio and photography"
-        for name in gtr_orgs_rel["name"]
-    ]
-
-    gtr_orgs_rel = gtr_orgs_rel.rename(
-        columns={"id": "gtr_id", "name": "gtr_name"}
-    ).drop(axis=1, labels=["addresses"])
-
-    # Reassign any musesums to the museum sector
-    orgs_final = pd.concat([orgs, gtr_orgs_rel])
-    orgs_final["creative_sector"] = [
-        "Museums galleries and libraries"
-        if any(r in row["gtr_name"].lower() for r in museum)
-        else row["creative_sector"]
-        for _, row in orgs_final.iterrows()
-    ]
-
-    return orgs_final
+    return apply_schema(joined, "gtr_projects")
 
 
 def filter_projects(
-    projects: pd.DataFrame, link: pd.DataFrame, funders: pd.DataFrame
+    projects: pd.DataFrame,
+    link: Optional[pd.DataFrame],
+    funders: pd.DataFrame,
 ) -> pd.DataFrame:
     """Merges GTR projects with funding information and filters by year
     Args:
         projects: project_table
-        link: link between projects and other gtr metadata
+        link: link between projects and other gtr metadata. If None, the
+            funds of `projects` are looked up in the link store
         funders: funder information including project start date
     Returns:
         Expanded and filtered project list
     """
+    if link is None:
+        fund_links = get_link_relation("gtr_funds").links_of_projects(projects["id"])
+    else:
+        fund_links = link.query("table_name=='gtr_funds'")
+
     projects_filt = (
         projects.rename(columns={"id": "project_id"})
-        .merge(link.query("table_name=='gtr_funds'"), on="project_id")
+        .merge(fund_links, on="project_id")
         .merge(funders[["id", "start"]], on="id")
         .drop_duplicates(subset=["project_id"])
         .assign(year=lambda df: df["start"].map(lambda x: x.year))
@@ -192,42 +263,46 @@ def filter_projects(
         .reset_index(drop=True)
     )
 
-    if creative is True:
-        orgs = orgs.dropna(axis=0, subset=["creative_sector"]).reset_index(drop=True)
-    else:
-        orgs = orgs.query("flag==False").fillna(value={"creative_sector": "Other"})
-
-    logging.info("Expanding gtr organisations")
-    orgs_final = expand_gtr_orgs(orgs)
-
-    return orgs_final
+    return projects_filt
 
 
-def get_gtr_topics():
-    return pd.read_csv(f"{PROJECT_DIR}/outputs/data/gtr/gtr_topic_mix.csv", index_col=0)
+def get_gtr_topics(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
+        f"{PROJECT_DIR}/outputs/data/gtr/gtr_topic_mix.csv",
+        columns,
+        filters,
+        index_col=0,
+    )
 
 
-def get_gtr_disciplines():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/gtr/predicted_disciplines.csv", index_col=0
+def get_gtr_disciplines(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
+        f"{PROJECT_DIR}/outputs/data/gtr/predicted_disciplines.csv",
+        columns,
+        filters,
+        index_col=0,
     )
 
 
-def get_project_orgs_lookup():
-    link = get_link_table().query("table_name=='gtr_organisations'")
-
-    return link[["id", "project_id"]]
+def get_project_orgs_lookup(filters: Optional[Filters] = None):
+    links = get_link_relation("gtr_organisations").to_frame()[["id", "project_id"]]
+    return select_table(links, filters=filters)
 
 
-def get_gtr_createch_tagged():
-    return pd.read_csv(
-        f"{PROJECT_DIR}/outputs/data/gtr_createch_tagged.csv", index_col=0
+def get_gtr_createch_tagged(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
+        f"{PROJECT_DIR}/outputs/data/gtr_createch_tagged.csv",
+        columns,
+        filters,
+        index_col=0,
     )
 
 
-def get_gtr_orgs_tagged():
-    return pd.read_csv(
+def get_gtr_orgs_tagged(columns: Optional[List[str]] = None, filters=None):
+    return get_csv(
         f"{PROJECT_DIR}/outputs/data/gtr/gtr_createch_orgs.csv",
+        columns,
+        filters,
         dtype={"SIC4_code": str},
     )
 
@@ -245,17 +320,14 @@ def expand_gtr_orgs(orgs):
     relevant = ["museum", "library", "gallery", "broadcasting", "bbc"]
     museum = ["museum", "library", "gallery"]
 
-    gtr_orgs_rel = gtr_orgs_uk.loc[
-        [any(r in name.lower() for r in relevant) for name in gtr_orgs_uk["name"]]
-    ]
+    gtr_orgs_rel = gtr_orgs_uk.loc[has_terms(gtr_orgs_uk["name"], relevant)]
     gtr_orgs_rel = gtr_orgs_rel.loc[~gtr_orgs_rel["id"].isin(orgs["gtr_id"])]
 
-    gtr_orgs_rel["creative_sector"] = [
-        "Museums galleries and libraries"
-        if any(m in name.lower() for m in ["museum", "library", "gallery"])
-        else "Film TV video radio and photography"
-        for name in gtr_orgs_rel["name"]
-    ]
+    gtr_orgs_rel["creative_sector"] = label_terms(
+        gtr_orgs_rel["name"],
+        {"Museums galleries and libraries": museum},
+        default="Film TV video radio and photography",
+    )
 
     gtr_orgs_rel = gtr_orgs_rel.rename(
         columns={"id": "gtr_id", "name": "gtr_name"}
@@ -263,12 +335,10 @@ def expand_gtr_orgs(orgs):
 
     # Reassign any musesums to the museum sector
     orgs_final = pd.concat([orgs, gtr_orgs_rel])
-    orgs_final["creative_sector"] = [
-        "Museums galleries and libraries"
-        if any(r in row["gtr_name"].lower() for r in museum)
-        else row["creative_sector"]
-        for _, row in orgs_final.iterrows()
-    ]
+    orgs_final["creative_sector"] = orgs_final["creative_sector"].mask(
+        has_terms(orgs_final["gtr_name"], museum).to_numpy(),
+        "Museums galleries and libraries",
+    )
 
     return orgs_final
 
@@ -1,43 +1,76 @@
 import logging
-from functools import lru_cache
+from typing import Dict, List, Optional
 
 import pandas as pd
-from metaflow import namespace, Run
 
 import createch
+from createch.getters.daps import Filters, rename_filters
+from createch.getters.metaflow_mirror import get_artifact
 
 logger = logging.getLogger(__name__)
-namespace(None)
 
 
-@lru_cache()
-def _flow(run_id: int) -> Run:
-    return Run(f"JacchammerFlow/{run_id}")
+FLOW_NAME: str = "JacchammerFlow"
 
 
-def get_gtr(run_id=None) -> pd.DataFrame:
+def _top_matches(
+    run_id: int,
+    names: Dict[str, str],
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    """Top matches of a run, renamed with `names`, with the columns and rows
+    (see `daps.apply_filters`) of the renamed table selected as it is read
+    """
+    originals = {new: old for old, new in names.items()}
+    if columns is not None:
+        columns = [originals.get(col, col) for col in columns]
+    return get_artifact(
+        FLOW_NAME,
+        run_id,
+        "full_top_matches",
+        columns=columns,
+        filters=rename_filters(filters, originals),
+    ).rename(columns=names)
+
+
+def get_gtr(
+    run_id=None,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
     """Return GtR-Companies House matches."""
     _run_id: int = run_id or createch.config["flows"]["jacchammer"]["gtr"]["run_id"]
-    return pd.DataFrame(_flow(_run_id).data.full_top_matches).rename(
-        columns={
+    return _top_matches(
+        _run_id,
+        {
             "index_y": "gtr_id",
             "names_y": "gtr_name",
             "index_x": "company_number",
             "names_x": "ch_name",
-        }
+        },
+        columns,
+        filters,
     )
 
 
-def get_crunchbase(run_id=None) -> pd.DataFrame:
+def get_crunchbase(
+    run_id=None,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
     """Return Crunchbase-Companies House matches."""
     _run_id: int = (
         run_id or createch.config["flows"]["jacchammer"]["crunchbase"]["run_id"]
     )
-    return pd.DataFrame(_flow(_run_id).data.full_top_matches).rename(
-        columns={
+    return _top_matches(
+        _run_id,
+        {
             "index_y": "cb_id",
             "names_y": "cb_name",
             "index_x": "company_number",
             "names_x": "ch_name",
-        }
+        },
+        columns,
+        filters,
     )
@@ -0,0 +1,182 @@
+# Indexed store of the relations in the GtR link table
+import logging
+import os
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from createch.utils.io import atomic_write
+
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n_rows: int):
+    """Index pointer and (sorted) column codes of each row"""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32), order
+
+
+def _gather(indptr: np.ndarray, codes: np.ndarray):
+    """Positions of the entries of the rows in `codes`, and the row of each"""
+    starts, ends = indptr[codes], indptr[codes + 1]
+    lengths = ends - starts
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(lengths.sum()), np.repeat(codes, lengths)
+
+
+class LinkRelation:
+    """Links between GtR projects and one other table (e.g. organisations)
+
+    Project and entity ids are integer-coded, and links are indexed both
+    ways in CSR form (an index pointer per project into the codes of its
+    entities, and vice versa), so that looking up the links of a project or
+    entity is O(degree). Arrays are read-only.
+    """
+
+    def __init__(
+        self,
+        project_ids: np.ndarray,
+        ids: np.ndarray,
+        rels: np.ndarray,
+        fwd_indptr: np.ndarray,
+        fwd_indices: np.ndarray,
+        fwd_rels: np.ndarray,
+        rev_indptr: np.ndarray,
+        rev_indices: np.ndarray,
+    ):
+        self.project_ids = project_ids
+        self.ids = ids
+        self.rels = rels
+        self.fwd_indptr = fwd_indptr
+        self.fwd_indices = fwd_indices
+        self.fwd_rels = fwd_rels
+        self.rev_indptr = rev_indptr
+        self.rev_indices = rev_indices
+        for array in self.arrays.values():
+            array.setflags(write=False)
+
+        self._project_index = pd.Index(project_ids)
+        self._index = pd.Index(ids)
+
+    @property
+    def arrays(self) -> dict:
+        return {
+            name: getattr(self, name)
+            for name in [
+                "project_ids",
+                "ids",
+                "rels",
+                "fwd_indptr",
+                "fwd_indices",
+                "fwd_rels",
+                "rev_indptr",
+                "rev_indices",
+            ]
+        }
+
+    @classmethod
+    def from_links(cls, links: pd.DataFrame) -> "LinkRelation":
+        """Index links from the link table
+        Args:
+            links: rows of the link table for one relation, with `project_id`,
+                `id` and `rel`
+        """
+        links = links.dropna(subset=["project_id", "id"])
+        project_codes, project_ids = pd.factorize(links["project_id"], sort=True)
+        codes, ids = pd.factorize(links["id"], sort=True)
+        rel_codes, rels = pd.factorize(links["rel"].astype(str))
+
+        fwd_indptr, fwd_indices, fwd_order = _csr(
+            project_codes, codes, len(project_ids)
+        )
+        rev_indptr, rev_indices, _ = _csr(codes, project_codes, len(ids))
+        return cls(
+            np.asarray(project_ids, dtype=str),
+            np.asarray(ids, dtype=str),
+            np.asarray(rels, dtype=str),
+            fwd_indptr,
+            fwd_indices,
+            rel_codes[fwd_order].astype(np.int16),
+            rev_indptr,
+            rev_indices,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "LinkRelation":
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def save(self, path: str):
+        np.savez(path, **self.arrays)
+
+    def ids_of(self, project_id: str) -> List[str]:
+        """Ids linked to a project"""
+        code = self._project_index.get_indexer([project_id])[0]
+        if code == -1:
+            return []
+        start, end = self.fwd_indptr[code], self.fwd_indptr[code + 1]
+        return self.ids[self.fwd_indices[start:end]].tolist()
+
+    def projects_of(self, id_: str) -> List[str]:
+        """Projects linked to an id (e.g. the projects of an organisation)"""
+        code = self._index.get_indexer([id_])[0]
+        if code == -1:
+            return []
+        start, end = self.rev_indptr[code], self.rev_indptr[code + 1]
+        return self.project_ids[self.rev_indices[start:end]].tolist()
+
+    def links_of_projects(self, project_ids: Iterable[str]) -> pd.DataFrame:
+        """Links of some projects
+        Returns:
+            table with `id`, `project_id` and `rel`
+        """
+        codes = self._project_index.get_indexer(pd.unique(np.asarray(project_ids)))
+        positions, project_codes = _gather(self.fwd_indptr, codes[codes != -1])
+        return self._frame(
+            self.fwd_indices[positions], project_codes, self.fwd_rels[positions]
+        )
+
+    def links_of_ids(self, ids: Iterable[str]) -> pd.DataFrame:
+        """Links of some ids (e.g. organisations)
+        Returns:
+            table with `id` and `project_id`
+        """
+        codes = self._index.get_indexer(pd.unique(np.asarray(ids)))
+        positions, id_codes = _gather(self.rev_indptr, codes[codes != -1])
+        return self._frame(id_codes, self.rev_indices[positions])
+
+    def to_frame(self) -> pd.DataFrame:
+        """All links, as in the link table
+        Returns:
+            table with `id`, `project_id` and `rel`
+        """
+        project_codes = np.repeat(
+            np.arange(len(self.project_ids)), np.diff(self.fwd_indptr)
+        )
+        return self._frame(self.fwd_indices, project_codes, self.fwd_rels)
+
+    def _frame(self, codes, project_codes, rel_codes=None) -> pd.DataFrame:
+        frame = pd.DataFrame(
+            {
+                "id": self.ids[codes].astype(object),
+                "project_id": self.project_ids[project_codes].astype(object),
+            }
+        )
+        if rel_codes is not None:
+            frame["rel"] = self.rels[rel_codes].astype(object)
+        return frame
+
+
+def build_link_store(link_table: pd.DataFrame, path: str):
+    """Save one indexed `LinkRelation` per table in the link table
+    Args:
+        link_table: GtR link table
+        path: directory to save `{table_name}.npz` files in
+    """
+    os.makedirs(path, exist_ok=True)
+    for table_name, links in link_table.groupby("table_name", observed=True):
+        logging.info(f"Indexing {len(links)} links to {table_name}")
+        relation = LinkRelation.from_links(links)
+        with atomic_write(f"{path}/{table_name}.npz") as tmp_path:
+            relation.save(tmp_path)
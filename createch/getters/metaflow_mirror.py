@@ -0,0 +1,156 @@
+# Local Parquet mirror of Metaflow run artifacts
+import logging
+import os
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+import pandas as pd
+from metaflow import namespace, Run
+
+from createch import config, PROJECT_DIR
+from createch.getters.cache import memoise
+from createch.getters.daps import Filters, select_table
+from createch.pipeline.fetch_daps1_data.schemas import cast_dtypes
+from createch.utils.io import atomic_write
+
+namespace(None)
+
+MIRROR_DIR = f"{PROJECT_DIR}/inputs/data/metaflow"
+MIRROR_CONFIG = config["metaflow_mirror"]
+
+# Declared dtypes of the artifacts we mirror. Other text columns are saved
+# as strings
+ARTIFACT_DTYPES = {
+    "organisation": {"company_number": "str"},
+    "organisationaddress": {"company_number": "str", "address_id": "str"},
+    "address": {"address_id": "str", "postcode": "str"},
+    "organisationsector": {
+        "company_number": "str",
+        "sector_id": "str",
+        "rank": "Int64",
+        "date": "datetime64[ns]",
+    },
+    "organisationname": {"company_number": "str", "name": "str"},
+    "full_top_matches": {
+        "index_x": "str",
+        "names_x": "str",
+        "index_y": "str",
+        "names_y": "str",
+    },
+}
+
+
+@lru_cache()
+def _run(flow_name: str, run_id: int) -> Run:
+    return Run(f"{flow_name}/{run_id}")
+
+
+def _load_artifact(flow_name: str, run_id: int, artifact: str) -> pd.DataFrame:
+    return pd.DataFrame(getattr(_run(flow_name, run_id).data, artifact))
+
+
+def mirror_path(flow_name: str, run_id: int, artifact: str) -> str:
+    return f"{MIRROR_DIR}/{flow_name}/{run_id}/{artifact}.parquet"
+
+
+def mirror_artifact(flow_name: str, run_id: int, artifact: str) -> str:
+    """Save an artifact of a run to the local mirror, with declared dtypes
+    Args:
+        flow_name: name of the flow (e.g. `CompaniesHouseMergeDumpFlow`)
+        run_id: id of the run
+        artifact: name of the artifact (a table)
+    Returns:
+        path of the mirrored artifact
+    """
+    logging.info(f"Mirroring {artifact} of {flow_name}/{run_id}")
+    table = _load_artifact(flow_name, run_id, artifact)
+    dtypes = {col: "str" for col in table.select_dtypes("object").columns}
+    table = cast_dtypes(table, {**dtypes, **ARTIFACT_DTYPES.get(artifact, {})})
+
+    path = mirror_path(flow_name, run_id, artifact)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path) as tmp_path:
+        table.to_parquet(tmp_path, index=False)
+    return path
+
+
+def mirror_run(flow_name: str, run_id: int, artifacts: Iterable[str]) -> List[str]:
+    """Save some artifacts of a run to the local mirror"""
+    return [mirror_artifact(flow_name, run_id, artifact) for artifact in artifacts]
+
+
+def artifact_paths(flow_name: str, run_id: int, artifact: str, *args, **kwargs):
+    return [mirror_path(flow_name, run_id, artifact)]
+
+
+def _read_artifact(
+    flow_name: str,
+    run_id: int,
+    artifact: str,
+    use_mirror: bool,
+    offline: bool,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+) -> pd.DataFrame:
+    if not use_mirror and not offline:
+        table = _load_artifact(flow_name, run_id, artifact)
+        return select_table(table, columns, filters)
+
+    path = mirror_path(flow_name, run_id, artifact)
+    if not os.path.exists(path):
+        if offline:
+            raise FileNotFoundError(
+                f"{artifact} of {flow_name}/{run_id} is not mirrored and we are offline"
+            )
+        mirror_artifact(flow_name, run_id, artifact)
+    return pd.read_parquet(path, columns=columns, filters=filters)
+
+
+@memoise(artifact_paths, maxsize=2)
+def _read_whole_artifact(
+    flow_name: str, run_id: int, artifact: str, use_mirror: bool, offline: bool
+) -> pd.DataFrame:
+    return _read_artifact(flow_name, run_id, artifact, use_mirror, offline)
+
+
+def get_artifact(
+    flow_name: str,
+    run_id: int,
+    artifact: str,
+    columns: Optional[List[str]] = None,
+    filters: Optional[Filters] = None,
+    use_mirror: Optional[bool] = None,
+    offline: Optional[bool] = None,
+) -> pd.DataFrame:
+    """Read an artifact of a run, from the local mirror if possible
+
+    Artifacts are mirrored the first time they are read, so later reads
+    (and other processes) skip Metaflow and only read the columns they need.
+    The last whole artifacts read are kept in memory until their mirror
+    changes (see `cache.memoise`).
+
+    Args:
+        flow_name: name of the flow
+        run_id: id of the run
+        artifact: name of the artifact (a table)
+        columns: columns to read. If None, reads all
+        filters: `pyarrow.parquet`-style row filters
+        use_mirror: if False, read the artifact from Metaflow (unless
+            offline). Defaults to `metaflow_mirror.enabled` in the base config
+        offline: if True, only read from the mirror. Defaults to
+            `metaflow_mirror.offline` in the base config or `CREATECH_OFFLINE`
+    Returns:
+        artifact table
+
+    Raises:
+        FileNotFoundError if offline and the artifact is not mirrored
+    """
+    use_mirror = MIRROR_CONFIG["enabled"] if use_mirror is None else use_mirror
+    if offline is None:
+        offline = MIRROR_CONFIG["offline"] or bool(os.getenv("CREATECH_OFFLINE"))
+
+    if columns is None and filters is None:
+        return _read_whole_artifact(flow_name, run_id, artifact, use_mirror, offline)
+    return _read_artifact(
+        flow_name, run_id, artifact, use_mirror, offline, columns, filters
+    )
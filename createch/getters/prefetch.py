@@ -0,0 +1,60 @@
+# Load several getters' data concurrently in the background
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+# A getter, or a getter with its positional and keyword arguments
+Call = Union[Callable[[], Any], Tuple[Callable, tuple], Tuple[Callable, tuple, dict]]
+
+
+class Prefetched:
+    """Results of prefetched getter calls, by name
+
+    Indexing waits for (and returns) a result, so reading sections can start
+    all their loads at once and use each one as soon as it is needed:
+
+        data = prefetch({"projects": get_gtr_projects, "orgs": get_organisations})
+        projects = data["projects"]  # Orgs keep loading meanwhile
+
+    Errors raised by a getter are raised when its result is read.
+    """
+
+    def __init__(self, futures: Dict[str, Future]):
+        self.futures = futures
+
+    def __getitem__(self, name: str) -> Any:
+        return self.futures[name].result()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.futures
+
+    def done(self, name: str) -> bool:
+        """Whether a call has finished (without waiting for it)"""
+        return self.futures[name].done()
+
+    def results(self) -> Dict[str, Any]:
+        """Wait for all calls and return their results"""
+        return {name: self[name] for name in self.futures}
+
+
+def prefetch(calls: Dict[str, Call], max_workers: Optional[int] = None) -> Prefetched:
+    """Start getter calls concurrently on a thread pool
+
+    Getters are I/O- and parse-bound (pandas and pyarrow release the GIL
+    while reading), so independent loads overlap and take about as long as
+    the slowest one. Memoised getters (see `cache.memoise`) return the
+    prefetched data if they are called again.
+
+    Args:
+        calls: name to getter, or to `(getter, args)` / `(getter, args, kwargs)`
+        max_workers: number of threads. Defaults to one per call
+    Returns:
+        futures of the results, by name
+    """
+    executor = ThreadPoolExecutor(max_workers=max_workers or len(calls) or 1)
+    futures = {}
+    for name, call in calls.items():
+        getter, args, kwargs = (call, (), {}) if callable(call) else (*call, {})[:3]
+        futures[name] = executor.submit(getter, *args, **kwargs)
+    # Threads exit once the calls finish, without blocking the caller
+    executor.shutdown(wait=False)
+    return Prefetched(futures)
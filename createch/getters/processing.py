@@ -1,32 +1,52 @@
 # Getters for use while processing data
 
 import json
+import os
 import pickle
+from typing import List
 
 from createch import PROJECT_DIR
+from createch.getters.cache import memoise
+from createch.getters.token_store import (
+    ARRAYS,
+    convert_legacy_store,
+    is_saved,
+    save_token_store,
+    TokenStore,
+)
+
+
+def _tokenised_path(name: str) -> str:
+    """Directory of the token store of `{source}_tokenised`"""
+    source = "crunchbase" if "crunchbase" in name else "gtr"
+    return f"{PROJECT_DIR}/outputs/data/{source}/{name}"
 
 
 def save_tokenised(lookup: dict, name: str):
-    """Saves lookup betweeen ids and tokenised descriptions"""
-
-    if "crunchbase" in name:
-        with open(f"{PROJECT_DIR}/outputs/data/crunchbase/{name}.json", "w") as outfile:
-            json.dump(lookup, outfile)
-    elif "gtr" in name:
-        with open(f"{PROJECT_DIR}/outputs/data/gtr/{name}.json", "w") as outfile:
-            json.dump(lookup, outfile)
-
-
-def get_tokenised(name: dict):
-    """Reads lookup betweeen ids and tokenised descriptions"""
-
-    if "crunchbase" in name:
-        with open(f"{PROJECT_DIR}/outputs/data/crunchbase/{name}.json", "r") as infile:
-            tok = json.load(infile)
-    elif "gtr" in name:
-        with open(f"{PROJECT_DIR}/outputs/data/gtr/{name}.json", "r") as infile:
-            tok = json.load(infile)
-    return tok
+    """Saves lookup betweeen ids and tokenised descriptions (as a token store)"""
+    save_token_store(lookup, _tokenised_path(name))
+
+
+def _token_store_paths(name: str) -> List[str]:
+    return [f"{_tokenised_path(name)}/{array}.npy" for array in ARRAYS]
+
+
+@memoise(_token_store_paths, copy_results=False)
+def get_tokenised(name: str) -> TokenStore:
+    """Reads lookup betweeen ids and tokenised descriptions
+
+    The lookup is a memory-mapped `TokenStore`, which behaves like a dict.
+    Lookups saved as JSON (or as older token stores) by earlier versions are
+    converted the first time.
+    """
+    path = _tokenised_path(name)
+    if not is_saved(path):
+        if os.path.exists(f"{path}/vocab.npy"):
+            convert_legacy_store(path)
+        else:
+            with open(f"{path}.json", "r") as infile:
+                save_token_store(json.load(infile), path)
+    return TokenStore.load(path)
 
 
 def save_model(model, path):
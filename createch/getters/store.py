@@ -0,0 +1,180 @@
+# Optional embedded (SQLite) store of the tables read by the getters
+import datetime
+import json
+import logging
+import os
+import sqlite3
+from typing import Any, Callable, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from createch import config, PROJECT_DIR
+from createch.getters.cache import file_state
+
+STORE_CONFIG = config["analytical_store"]
+STORE_PATH = f"{PROJECT_DIR}/{STORE_CONFIG['path']}"
+
+# Columns indexed in each table (other tables are stored without indexes)
+TABLE_INDEXES = {
+    "gtr_projects": ["project_id"],
+    "gtr_link_table": ["project_id", "id", "table_name"],
+    "gtr_organisations": ["id"],
+    "gtr_organisations_creative": ["gtr_id", "company_number"],
+    "gtr_organisations_all": ["gtr_id", "company_number"],
+    "crunchbase_organisations": ["id"],
+    "crunchbase_organizations_categories": ["organization_id"],
+    "crunchbase_funding_rounds": ["org_id"],
+}
+
+SQL_OPS = {
+    "==": "=",
+    "=": "=",
+    "!=": "!=",
+    "<": "<",
+    "<=": "<=",
+    ">": ">",
+    ">=": ">=",
+    "in": "IN",
+    "not in": "NOT IN",
+}
+
+
+def use_store() -> bool:
+    """Whether getters read through the store (`analytical_store.enabled` in
+    the base config, or `CREATECH_STORE`)
+    """
+    return STORE_CONFIG["enabled"] or bool(os.getenv("CREATECH_STORE"))
+
+
+def connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(STORE_PATH), exist_ok=True)
+    con = sqlite3.connect(STORE_PATH, timeout=60)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS _sources (name TEXT PRIMARY KEY, state TEXT)"
+    )
+    return con
+
+
+def _quote(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def _sources_state(sources: Iterable[str]) -> str:
+    return json.dumps([file_state(path) for path in sources])
+
+
+def load_table(
+    name: str,
+    table: pd.DataFrame,
+    sources: Iterable[str] = (),
+    indexes: Optional[List[str]] = None,
+):
+    """Load a table into the store, replacing any previous version
+    Args:
+        name: table name
+        table: table to load
+        sources: files the table was read from, so that it is reloaded when
+            they change (see `ensure_table`)
+        indexes: columns to index. Defaults to `TABLE_INDEXES`
+    """
+    logging.info(f"Loading {len(table)} rows of {name} into the store")
+    indexes = TABLE_INDEXES.get(name, []) if indexes is None else indexes
+    con = connect()
+    try:
+        with con:
+            con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+            table.to_sql(name, con, index=False, chunksize=10_000)
+            for column in indexes:
+                if column in table.columns:
+                    con.execute(
+                        f"CREATE INDEX {_quote(f'{name}_{column}')} "
+                        f"ON {_quote(name)} ({_quote(column)})"
+                    )
+            con.execute(
+                "INSERT OR REPLACE INTO _sources VALUES (?, ?)",
+                (name, _sources_state(sources)),
+            )
+    finally:
+        con.close()
+
+
+def ensure_table(
+    name: str,
+    loader: Callable[[], pd.DataFrame],
+    sources: Iterable[str],
+    indexes: Optional[List[str]] = None,
+):
+    """Load a table into the store if it is missing or its sources changed
+    Args:
+        name: table name
+        loader: function that reads the table from its sources
+        sources: files the table is read from
+        indexes: columns to index. Defaults to `TABLE_INDEXES`
+    """
+    sources = list(sources)
+    con = connect()
+    try:
+        row = con.execute(
+            "SELECT state FROM _sources WHERE name = ?", (name,)
+        ).fetchone()
+    finally:
+        con.close()
+    if row is None or row[0] != _sources_state(sources):
+        load_table(name, loader(), sources, indexes)
+
+
+def columns(name: str) -> List[str]:
+    """Columns of a stored table"""
+    con = connect()
+    try:
+        return [row[1] for row in con.execute(f"PRAGMA table_info({_quote(name)})")]
+    finally:
+        con.close()
+
+
+def _param(value: Any) -> Any:
+    """Value as a type sqlite3 can bind"""
+    if isinstance(value, (pd.Timestamp, datetime.date)):
+        return str(pd.Timestamp(value))  # As `to_sql` stores datetimes
+    return value.item() if hasattr(value, "item") else value
+
+
+def where_clause(filters: Optional[List[Any]]) -> Tuple[str, list]:
+    """Parameterised SQL condition of `pyarrow.parquet`-style row filters"""
+    if not filters:
+        return "", []
+    conjunctions = [filters] if isinstance(filters[0], tuple) else filters
+
+    params = []
+    ors = []
+    for conjunction in conjunctions:
+        ands = []
+        for column, op, value in conjunction:
+            if op in ("in", "not in"):
+                value = list(value)
+                placeholders = ", ".join("?" * len(value))
+                ands.append(f"{_quote(column)} {SQL_OPS[op]} ({placeholders})")
+                params.extend(_param(val) for val in value)
+            else:
+                ands.append(f"{_quote(column)} {SQL_OPS[op]} ?")
+                params.append(_param(value))
+        ors.append("(" + " AND ".join(ands) + ")")
+    return " WHERE " + " OR ".join(ors), params
+
+
+def query(sql: str, params: Iterable[Any] = ()) -> pd.DataFrame:
+    """Run a parameterised query against the store"""
+    con = connect()
+    try:
+        return pd.read_sql_query(sql, con, params=list(params))
+    finally:
+        con.close()
+
+
+def select(
+    name: str, columns: Optional[List[str]] = None, filters: Optional[List[Any]] = None
+) -> pd.DataFrame:
+    """Read the columns and rows (see `daps.apply_filters`) of a stored table"""
+    fields = "*" if columns is None else ", ".join(_quote(col) for col in columns)
+    where, params = where_clause(filters)
+    return query(f"SELECT {fields} FROM {_quote(name)}{where}", params)
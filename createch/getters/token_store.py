@@ -0,0 +1,241 @@
+# Memory-mapped store of tokenised documents
+import logging
+import os
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from createch.utils.io import atomic_write
+
+# Arrays of a store, each saved as `{path}/{name}.npy`. Strings (the
+# vocabulary and ids) are saved as concatenated UTF-8 bytes (`{name}_data`)
+# and the offset of each string into them (`{name}_offsets`)
+ARRAYS = [
+    "vocab_data",
+    "vocab_offsets",
+    "ids_data",
+    "ids_offsets",
+    "offsets",
+    "tokens",
+    "sorted_docs",
+]
+
+# Fixed-width string arrays of stores saved by earlier versions
+LEGACY_ARRAYS = ["vocab", "ids", "sorted_ids"]
+
+
+class Strings(Sequence):
+    """Read-only sequence of strings saved as concatenated UTF-8 bytes and the
+    offset of each string into them, so that long strings don't pad the others
+    """
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: Iterable[str]) -> "Strings":
+        data = bytearray()
+        offsets = array("q", [0])
+        for string in strings:
+            data += string.encode()
+            offsets.append(len(data))
+        return cls(
+            np.frombuffer(bytes(data), dtype=np.uint8),
+            np.frombuffer(offsets, dtype=np.int64),
+        )
+
+    def __getitem__(self, i: int) -> str:
+        return self.data[self.offsets[i] : self.offsets[i + 1]].tobytes().decode()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class _Sorted(Sequence):
+    """Strings in a sorted order (positions of the strings, in order)"""
+
+    def __init__(self, strings: Sequence, order: np.ndarray):
+        self.strings = strings
+        self.order = order
+
+    def __getitem__(self, i: int) -> str:
+        return self.strings[self.order[i]]
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+
+class TokenStore(Mapping):
+    """Read-only lookup between ids and tokenised documents
+
+    Tokens are saved as int32 codes into a vocabulary, concatenated across
+    documents, with the offset of each document into them. Documents are
+    also saved in the order of their ids, so that looking up a document is a
+    binary search. Arrays are memory-mapped, so opening a store is cheap and
+    only the documents that are read are paged in.
+
+    Behaves like a dict of `id -> list of tokens` in document order.
+    `values()` can be iterated several times, so it can be passed to gensim
+    as a streamed corpus.
+    """
+
+    def __init__(
+        self,
+        vocab: Sequence,
+        ids: Sequence,
+        offsets: np.ndarray,
+        tokens: np.ndarray,
+        sorted_docs: np.ndarray,
+        docs: Optional[np.ndarray] = None,
+    ):
+        self.vocab = vocab
+        self.ids = ids
+        self.offsets = offsets
+        self.tokens = tokens
+        self.sorted_docs = sorted_docs
+        self._sorted_ids = _Sorted(ids, sorted_docs)
+        # Every token read is looked up, so the vocabulary is decoded once
+        self._words = None
+        # Documents in this (sub)store, all by default
+        self.docs = np.arange(len(ids)) if docs is None else docs
+        self._selected = None
+        if docs is not None:
+            self._selected = np.zeros(len(ids), dtype=bool)
+            self._selected[docs] = True
+
+    @classmethod
+    def load(cls, path: str) -> "TokenStore":
+        arrays = {name: np.load(f"{path}/{name}.npy", mmap_mode="r") for name in ARRAYS}
+        return cls(
+            Strings(arrays["vocab_data"], arrays["vocab_offsets"]),
+            Strings(arrays["ids_data"], arrays["ids_offsets"]),
+            arrays["offsets"],
+            arrays["tokens"],
+            arrays["sorted_docs"],
+        )
+
+    def _doc(self, id_: str) -> int:
+        """Position of the document of an id (-1 if missing)"""
+        if not isinstance(id_, str):
+            return -1
+        pos = bisect_left(self._sorted_ids, id_)
+        if pos == len(self._sorted_ids) or self._sorted_ids[pos] != id_:
+            return -1
+        return int(self.sorted_docs[pos])
+
+    def _tokens(self, doc: int) -> List[str]:
+        if self._words is None:
+            self._words = list(self.vocab)
+        codes = self.tokens[self.offsets[doc] : self.offsets[doc + 1]]
+        return [self._words[code] for code in codes.tolist()]
+
+    def __getitem__(self, id_: str) -> List[str]:
+        doc = self._doc(id_)
+        if doc == -1 or (self._selected is not None and not self._selected[doc]):
+            raise KeyError(id_)
+        return self._tokens(doc)
+
+    def __contains__(self, id_) -> bool:
+        try:
+            self[id_]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[str]:
+        for doc in self.docs:
+            yield str(self.ids[doc])
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def items(self) -> Iterator:
+        """(id, tokens) of each document, read one document at a time"""
+        for doc in self.docs:
+            yield str(self.ids[doc]), self._tokens(doc)
+
+    def values(self) -> "Documents":
+        """Tokens of each document, read one document at a time"""
+        return Documents(self)
+
+    def subset(self, ids: Iterable[str]) -> "TokenStore":
+        """Store with only the documents of `ids` (missing ids are ignored),
+        in document order. Shares the arrays of this store
+        """
+        docs = np.asarray([self._doc(id_) for id_ in ids], dtype=np.int64)
+        docs = np.unique(docs[docs != -1])
+        if self._selected is not None:
+            docs = docs[self._selected[docs]]
+        return TokenStore(
+            self.vocab, self.ids, self.offsets, self.tokens, self.sorted_docs, docs
+        )
+
+
+class Documents:
+    """Streamed (and re-iterable) tokens of the documents of a store"""
+
+    def __init__(self, store: TokenStore):
+        self.store = store
+
+    def __iter__(self) -> Iterator[List[str]]:
+        for doc in self.store.docs:
+            yield self.store._tokens(doc)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+
+def is_saved(path: str) -> bool:
+    """Whether a complete token store is saved in `path`"""
+    return all(os.path.exists(f"{path}/{name}.npy") for name in ARRAYS)
+
+
+def save_token_store(lookup: Dict[str, List[str]], path: str):
+    """Save a lookup between ids and tokenised documents as a `TokenStore`
+    Args:
+        lookup: id to list of tokens. Can be any mapping with `items()`
+        path: directory to save the arrays in
+    """
+    logging.info(f"Saving {len(lookup)} tokenised documents to {path}")
+    vocab: Dict[str, int] = {}
+    tokens = array("i")
+    offsets = array("q", [0])
+    ids = []
+    for id_, doc in lookup.items():
+        ids.append(str(id_))
+        tokens.extend(vocab.setdefault(token, len(vocab)) for token in doc)
+        offsets.append(len(tokens))
+
+    vocab_strings = Strings.from_strings(vocab)
+    id_strings = Strings.from_strings(ids)
+    arrays = {
+        "vocab_data": vocab_strings.data,
+        "vocab_offsets": vocab_strings.offsets,
+        "ids_data": id_strings.data,
+        "ids_offsets": id_strings.offsets,
+        "offsets": np.frombuffer(offsets, dtype=np.int64),
+        "tokens": np.frombuffer(tokens, dtype=np.int32),
+        "sorted_docs": np.asarray(
+            sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int64
+        ),
+    }
+
+    os.makedirs(path, exist_ok=True)
+    for name, values in arrays.items():
+        with atomic_write(f"{path}/{name}.npy") as tmp_path:
+            np.save(tmp_path, values)
+
+
+def convert_legacy_store(path: str):
+    """Re-save a store saved with fixed-width string arrays by earlier versions"""
+    arrays = {
+        name: np.load(f"{path}/{name}.npy", mmap_mode="r")
+        for name in ["vocab", "ids", "offsets", "tokens", "sorted_docs"]
+    }
+    save_token_store(dict(TokenStore(**arrays).items()), path)
+    for name in LEGACY_ARRAYS:
+        os.remove(f"{path}/{name}.npy")
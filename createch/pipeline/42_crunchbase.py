@@ -36,7 +36,7 @@ from createch.pipeline.network_analysis import make_network_from_coocc, make_top
 from createch.utils.altair_network import *
 from createch.pipeline.utils import has_createch_sector
 from createch.utils.altair_save_utils import *
-from createch.utils.io import get_lookup
+from createch.utils.io import open_lookup
 from cdlib import algorithms
 from itertools import chain
 from numpy.random import choice
@@ -67,7 +67,7 @@ cb_topics, filtered_topics = filter_topics(
 orgs = get_crunchbase_orgs()
 org_descr_lookup = make_org_description_lu(orgs)
 
-cb_area_tagged = get_lookup("outputs/data/crunchbase/crunchbase_area_tagged")
+cb_area_tagged = open_lookup("outputs/data/crunchbase/crunchbase_area_tagged")
 
 comp_industry = get_crunchbase_industry_pred()
 cb_ch_orgs = get_cb_ch_organisations(creative=False)
@@ -32,12 +32,13 @@ from createch.getters.gtr import (
     get_gtr_topics,
     get_gtr_disciplines,
 )
+from createch.getters.prefetch import prefetch
 from createch.pipeline.topic_modelling import filter_topics
 from createch.pipeline.network_analysis import make_network_from_coocc, make_topic_coocc
 from createch.utils.altair_network import *
 from createch.pipeline.utils import has_createch_sector
 from createch.utils.altair_save_utils import *
-from createch.utils.io import get_lookup
+from createch.utils.io import open_lookup
 from cdlib import algorithms
 from itertools import chain
 
@@ -114,10 +115,21 @@ def make_project_discipline_distribution(topics, disc_lookup, threshold):
 # ### Read data
 
 # +
+# Start all loads at once, they are independent
+data = prefetch(
+    {
+        "topics": get_gtr_topics,
+        "disciplines": get_gtr_disciplines,
+        "projects": get_gtr_projects,
+        "orgs": get_organisations,
+        "org_proj_lookup": get_project_orgs_lookup,
+    }
+)
+
 # Topic mix and discipline classification
-topics = get_gtr_topics()
-disciplines = get_gtr_disciplines()
-projects = get_gtr_projects()
+topics = data["topics"]
+disciplines = data["disciplines"]
+projects = data["projects"]
 
 
 # Create lookups
@@ -125,11 +137,11 @@ project_title_lookup = projects.set_index("project_id")["title"].to_dict()
 project_disc_lookup = disciplines.idxmax(axis=1).to_dict()
 # -
 
-orgs = get_organisations()
+orgs = data["orgs"]
 
-org_proj_lookup = get_project_orgs_lookup()
+org_proj_lookup = data["org_proj_lookup"]
 
-gtr_area_tagged = get_lookup("outputs/data/gtr/gtr_area_tagged")
+gtr_area_tagged = open_lookup("outputs/data/gtr/gtr_area_tagged")
 project_date_lookup = {
     row["project_id"]: row["start"].year for _, row in projects.iterrows()
 }
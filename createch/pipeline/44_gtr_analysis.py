@@ -41,6 +41,7 @@ from createch.getters.gtr import (
     get_gtr_topics,
     get_gtr_disciplines,
 )
+from createch.getters.prefetch import prefetch
 from createch.pipeline.topic_modelling import filter_topics
 from createch.utils.sic_utils import (
     section_code_lookup,
@@ -74,13 +75,28 @@ def change_font_sizes(alt_chart):
 
 # ## 1. Reading
 
-projects = get_gtr_projects()
-disciplines = get_gtr_disciplines()
+# Start all loads at once, they are independent
+data = prefetch(
+    {
+        "projects": (
+            get_gtr_projects,
+            (),
+            {"columns": ["project_id", "title", "start", "abstractText"]},
+        ),
+        "disciplines": get_gtr_disciplines,
+        "orgs_projects_link": get_project_orgs_lookup,
+        "projects_createch": get_gtr_createch_tagged,
+        "orgs_createch": get_gtr_orgs_tagged,
+    }
+)
 
-orgs_projects_link = get_project_orgs_lookup()
+projects = data["projects"]
+disciplines = data["disciplines"]
 
-projects_createch = get_gtr_createch_tagged()
-orgs_createch = get_gtr_orgs_tagged()
+orgs_projects_link = data["orgs_projects_link"]
+
+projects_createch = data["projects_createch"]
+orgs_createch = data["orgs_createch"]
 
 # +
 div_section_lookup = section_code_lookup()
@@ -673,6 +689,7 @@ import networkx as nx
 from createch.pipeline.network_analysis import make_network_from_coocc
 from createch.utils.altair_network import plot_altair_network
 from createch.getters.daps import fetch_daps_table
+from createch.utils.text_match import has_terms
 from cdlib import algorithms
 from createch import config
 
@@ -725,14 +742,14 @@ org_proj_link_createch = (
 # Additional labels
 orgs_ch_id = set(orgs_createch["org_id"])
 
-org_proj_link_createch["segment"] = [
-    "Industry"
-    if r["id"] in orgs_ch_id
-    else "Academic"
-    if any(t in r["name"].lower() for t in ed_terms)
-    else "Other"
-    for _id, r in org_proj_link_createch.iterrows()
-]
+org_proj_link_createch["segment"] = np.select(
+    [
+        org_proj_link_createch["id"].isin(orgs_ch_id),
+        has_terms(org_proj_link_createch["name"], ed_terms),
+    ],
+    ["Industry", "Academic"],
+    default="Other",
+)
 
 org_segment_lookup = (
     org_proj_link_createch.drop_duplicates("id").set_index("name")["segment"].to_dict()
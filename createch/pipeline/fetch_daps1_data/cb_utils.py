@@ -1,15 +1,33 @@
 import logging
+from itertools import chain
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Iterator, List, Optional
 
 import pandas as pd
-
-from daps1_utils import fetch_daps_table, save_daps_table
+from sqlalchemy import select
+from sqlalchemy.sql import Select
+
+from daps1_utils import (
+    fetch_daps_query,
+    fetch_daps_table,
+    fetch_save_daps_table_partitioned,
+    filter_chunks,
+    reflect_daps_table,
+    stream_save_daps_table,
+    sync_daps_table,
+)
 
 logger = logging.getLogger(__name__)
 
 CB_PATH = Path(__file__).parents[3] / "inputs/data/crunchbase"
 
+# Columns to incrementally sync crunchbase tables on (see `sync_daps_table`):
+# a timestamp set when a row changes, and the key of the rows it replaces
+CB_SYNC_COLUMNS = {
+    "crunchbase_organizations": ("updated_at", ["id"]),
+    "crunchbase_funding_rounds": ("updated_at", ["id"]),
+}
+
 
 def filter_uk(table: pd.DataFrame, ids: set, var_name: str = "org_id"):
     """Gets UK companies from crunchbase
@@ -23,35 +41,164 @@ def filter_uk(table: pd.DataFrame, ids: set, var_name: str = "org_id"):
     return table.loc[table[var_name].isin(ids)].reset_index(drop=True)
 
 
-def fetch_save_crunchbase():
-    """Fetch and save crunchbase data"""
-    cb_orgs = pd.concat(fetch_daps_table("crunchbase_organizations", fields="all"))
+def uk_orgs_query(con=None, columns: Optional[List[str]] = None) -> Select:
+    """Query for `crunchbase_organizations` in the UK
+    Args:
+        con: connection used to reflect the table
+        columns: columns to select. If None, selects all of them
+    Returns:
+        query
+    """
+    orgs = reflect_daps_table("crunchbase_organizations", con)
+    cols = [orgs] if columns is None else [orgs.c[col] for col in columns]
+    return select(cols).where(orgs.c.country == "United Kingdom")
+
+
+def uk_table_query(table_name: str, var_name: str = "org_id", con=None) -> Select:
+    """Query for the rows of a crunchbase table about UK organisations
 
-    cb_uk = cb_orgs.loc[cb_orgs["country"] == "United Kingdom"].drop_duplicates(
-        subset=["id"]
+    The filter is a semi-join on UK organisation ids so that it runs in
+    the database and only UK rows are transferred.
+
+    Args:
+        table_name: crunchbase table
+        var_name: name of org id variable
+        con: connection used to reflect the tables
+    Returns:
+        query
+    """
+    table = reflect_daps_table(table_name, con)
+    return select([table]).where(table.c[var_name].in_(uk_orgs_query(con, ["id"])))
+
+
+def fetch_uk_table(
+    table_name: str, var_name: str = "org_id", con=None, push_down: bool = True
+) -> Iterator[pd.DataFrame]:
+    """Stream the rows of a crunchbase table about UK organisations
+    Args:
+        table_name: crunchbase table
+        var_name: name of org id variable
+        con: connection to read from
+        push_down: whether to filter in the database (see `uk_table_query`).
+            If False, the whole table is streamed and filtered chunk by chunk
+    Returns:
+        UK rows
+    """
+    if push_down is True:
+        return fetch_daps_query(uk_table_query(table_name, var_name, con), con)
+
+    uk_ids = set(
+        chain.from_iterable(
+            chunk["id"] for chunk in fetch_daps_query(uk_orgs_query(con, ["id"]), con)
+        )
+    )
+    return filter_chunks(
+        fetch_daps_table(table_name, fields="all", con=con),
+        predicate=lambda chunk: chunk[var_name].isin(uk_ids),
     )
-    logging.info(len(cb_uk))
-    save_daps_table(cb_uk, "crunchbase_organisations", CB_PATH)
 
-    cb_uk_ids = set(cb_uk["id"])
 
-    cb_funding_rounds = pd.concat(
-        fetch_daps_table("crunchbase_funding_rounds", fields="all")
+def fetch_save_cb_orgs(
+    con=None, partitions: Optional[int] = None, incremental: bool = False
+):
+    """Fetch and save UK crunchbase organisations
+    Args:
+        con: connection to read from
+        partitions: if given, this many ranges of ids are read concurrently
+            (with pooled connections rather than `con`) and saved as parquet
+        incremental: whether to only fetch organisations updated since the
+            last sync (see `sync_daps_table`)
+    """
+    if incremental is True:
+        watermark_col, key = CB_SYNC_COLUMNS["crunchbase_organizations"]
+        sync_daps_table(
+            "crunchbase_organizations",
+            CB_PATH,
+            watermark_col,
+            name="crunchbase_organisations",
+            key=key,
+            query=uk_orgs_query(con),
+            con=con,
+        )
+        return
+
+    if partitions is not None:
+        fetch_save_daps_table_partitioned(
+            "crunchbase_organizations",
+            "crunchbase_organisations",
+            CB_PATH,
+            n_partitions=partitions,
+            config_path=con.engine.url if con is not None else None,
+            where=lambda orgs: orgs.c.country == "United Kingdom",
+            unique=True,
+        )
+        return
+
+    query = uk_orgs_query(con)
+    cb_uk = filter_chunks(fetch_daps_query(query, con), unique_on="id")
+    stream_save_daps_table(cb_uk, "crunchbase_organisations", CB_PATH, query=query)
+
+
+def fetch_save_cb_funding_rounds(
+    con=None, push_down: bool = True, incremental: bool = False
+):
+    """Fetch and save funding rounds of UK crunchbase organisations
+    Args:
+        con: connection to read from
+        push_down: whether to filter in the database (see `fetch_uk_table`)
+        incremental: whether to only fetch funding rounds updated since the
+            last sync (see `sync_daps_table`). Always filters in the database
+    """
+    query = uk_table_query("crunchbase_funding_rounds", "org_id", con)
+    if incremental is True:
+        watermark_col, key = CB_SYNC_COLUMNS["crunchbase_funding_rounds"]
+        sync_daps_table(
+            "crunchbase_funding_rounds",
+            CB_PATH,
+            watermark_col,
+            key=key,
+            query=query,
+            con=con,
+        )
+        return
+
+    cb_funding_rounds_uk = fetch_uk_table(
+        "crunchbase_funding_rounds", "org_id", con, push_down
+    )
+    stream_save_daps_table(
+        cb_funding_rounds_uk, "crunchbase_funding_rounds", CB_PATH, query=query
     )
-    cb_funding_rounds_uk = filter_uk(cb_funding_rounds, cb_uk_ids)
 
-    cb_orgs_cats = pd.concat(
-        fetch_daps_table("crunchbase_organizations_categories", fields="all")
+
+def fetch_save_cb_orgs_cats(con=None, push_down: bool = True):
+    """Fetch and save categories of UK crunchbase organisations"""
+    cb_org_cats_uk = fetch_uk_table(
+        "crunchbase_organizations_categories", "organization_id", con, push_down
+    )
+    stream_save_daps_table(
+        cb_org_cats_uk,
+        "crunchbase_organizations_categories",
+        CB_PATH,
+        query=uk_table_query(
+            "crunchbase_organizations_categories", "organization_id", con
+        ),
     )
-    cb_org_cats_uk = filter_uk(cb_orgs_cats, cb_uk_ids, "organization_id")
 
-    category_group = pd.concat(
-        fetch_daps_table("crunchbase_category_groups", fields="all")
+
+def fetch_save_cb_category_groups(con=None):
+    """Fetch and save the crunchbase category group lookup"""
+    category_group = fetch_daps_table(
+        "crunchbase_category_groups", fields="all", con=con
     )
+    stream_save_daps_table(category_group, "crunchbase_category_groups", CB_PATH)
+
 
-    save_daps_table(cb_funding_rounds_uk, "crunchbase_funding_rounds", CB_PATH)
-    save_daps_table(cb_org_cats_uk, "crunchbase_organizations_categories", CB_PATH)
-    save_daps_table(category_group, "crunchbase_category_groups", CB_PATH)
+def fetch_save_crunchbase(con=None, push_down: bool = True):
+    """Fetch and save crunchbase data"""
+    fetch_save_cb_orgs(con)
+    fetch_save_cb_funding_rounds(con, push_down)
+    fetch_save_cb_orgs_cats(con, push_down)
+    fetch_save_cb_category_groups(con)
 
 
 def get_uk_names(con) -> Dict[str, str]:
@@ -1,20 +1,111 @@
 # Generic scripts to get DAPS tables
+import gzip
+import json
 import logging
 import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
-from typing import Any, Dict, Iterator
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import partial
+from itertools import chain
+from queue import Full, Queue
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import and_, column, create_engine, func, MetaData, or_, select, Table
+from sqlalchemy.engine import Engine
 from sqlalchemy.engine.url import URL
+from sqlalchemy.sql import Select
+
+try:
+    import zstandard
+except ImportError:  # Only needed for zstd-compressed csv
+    zstandard = None
+
+try:
+    from createch.pipeline.fetch_daps1_data.schemas import (
+        apply_schema,
+        cast_dtypes,
+        get_dtypes,
+    )
+except ModuleNotFoundError:  # Running from this directory (e.g. in the flow)
+    from schemas import apply_schema, cast_dtypes, get_dtypes
 
 # from pandas._typing import FilePathOrBuffer  # Not available in pandas < 1
 
-MYSQL_CONFIG = os.environ["MYSQL_CONFIG"]
+MYSQL_CONFIG = os.getenv("MYSQL_CONFIG")
+
+# Target in-memory size of fetched chunks, and rows sampled to estimate it
+CHUNK_BYTES = 32 * 2**20
+SAMPLE_ROWS = 1000
+
+# Format DAPS extracts are saved in (see `WRITERS`)
+STORAGE_FORMAT = os.getenv("DAPS_STORAGE_FORMAT", "parquet")
+PARQUET_COMPRESSION = "zstd"
+
+# Compression of each compressed csv storage format
+CSV_COMPRESSION = {"csv.gz": "gzip", "csv.zst": "zstd"}
+
+# Part files of tables saved as a directory of parquet files
+PART_PATTERN = re.compile(r"^part-(\d+)\.parquet$")
+
+# Arrow types of the dtypes declared in `schemas.DTYPES` (categoricals are
+# streamed as strings, see `stream_save_daps_table`)
+DTYPE_ARROW_TYPES = {
+    "str": pa.string(),
+    "category": pa.string(),
+    "datetime64[ns]": pa.timestamp("ns"),
+    "float64": pa.float64(),
+    "Int64": pa.int64(),
+}
+
+# Arrow types of SQL columns, by the Python type of their values
+SQL_ARROW_TYPES = {
+    int: pa.int64(),
+    float: pa.float64(),
+    Decimal: pa.float64(),
+    str: pa.string(),
+    bool: pa.bool_(),
+    datetime: pa.timestamp("ns"),
+    date: pa.date32(),
+}
 
 
-def get_engine(config_path, database="production", **engine_kwargs):
-    """Get a SQL alchemy engine from config"""
+# Connection pool options for DAPS engines (see `get_engine`)
+POOL_OPTIONS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    "pool_pre_ping": True,
+    "pool_recycle": 3600,
+}
+
+# Engines shared across the process, keyed by config path, database and options
+_ENGINES: Dict[Tuple[str, str, str], Engine] = {}
+_ENGINES_LOCK = Lock()
+
+
+def _create_engine(config_path, database="production", **engine_kwargs) -> Engine:
+    if "://" in str(config_path):
+        if str(config_path).startswith("sqlite"):
+            # Chunks are fetched in a background thread (see `prefetch_chunks`)
+            engine_kwargs.setdefault("connect_args", {"check_same_thread": False})
+            # SQLite may not use a `QueuePool`, so only keep generic options
+            engine_kwargs = {
+                k: v
+                for k, v in engine_kwargs.items()
+                if k not in ["pool_size", "max_overflow"]
+            }
+        return create_engine(config_path, **engine_kwargs)
+
     cp = ConfigParser()
     cp.read(config_path)
     cp = cp["client"]
@@ -28,30 +119,360 @@ def get_engine(config_path, database="production", **engine_kwargs):
     return create_engine(url, **engine_kwargs)
 
 
-def fetch_daps_table(table_name: str, fields: str = "all") -> pd.DataFrame:
+def get_engine(config_path, database="production", **engine_kwargs) -> Engine:
+    """Get a SQL alchemy engine from config
+
+    Engines are pooled and shared across the process: calls with the same
+    config path, database and options return the same engine.
+    `config_path` may also be a SQLAlchemy URL (e.g. `sqlite:///daps.db`),
+    which lets the fetchers run against a local stand-in database.
+
+    Args:
+        config_path: path to a MySQL config file, or a SQLAlchemy URL
+        database: database name
+        engine_kwargs: extra arguments for `create_engine`. Override
+            `POOL_OPTIONS` (e.g. `pool_size`, `pool_recycle`)
+    Returns:
+        engine
+    """
+    engine_kwargs = {**POOL_OPTIONS, **engine_kwargs}
+    key = (str(config_path), database, repr(sorted(engine_kwargs.items())))
+
+    with _ENGINES_LOCK:
+        if key not in _ENGINES:
+            _ENGINES[key] = _create_engine(config_path, database, **engine_kwargs)
+        return _ENGINES[key]
+
+
+@contextmanager
+def daps_connection(con=None, config_path=None, database="production"):
+    """Context-managed connection to DAPS
+
+    Args:
+        con: an open connection. If given, it is reused and left open
+        config_path: config path or URL (see `get_engine`). If None, uses
+            `MYSQL_CONFIG`
+        database: database name
+    Returns:
+        connection, checked out of the shared engine's pool and returned to
+        it on exit
+    """
+    if con is not None:
+        yield con
+        return
+
+    with get_engine(config_path or MYSQL_CONFIG, database).connect() as new_con:
+        yield new_con
+
+
+def estimate_chunksize(query, con, target_bytes: int = CHUNK_BYTES) -> int:
+    """Number of rows per chunk that fits a memory budget
+
+    The width of a row is measured on a sample of the results.
+
+    Args:
+        query: SQLAlchemy selectable
+        con: connection to read from
+        target_bytes: target in-memory size of a chunk
+    Returns:
+        rows per chunk
+    """
+    sample = pd.read_sql_query(query.limit(SAMPLE_ROWS), con)
+    if len(sample) == 0:
+        return SAMPLE_ROWS
+
+    row_bytes = sample.memory_usage(index=False, deep=True).sum() / len(sample)
+    return max(int(target_bytes / row_bytes), 1)
+
+
+def fetch_daps_table(
+    table_name: str,
+    fields: str = "all",
+    con=None,
+    chunksize: Optional[int] = None,
+    partitions: Optional[int] = None,
+    key: str = "id",
+) -> Iterator[pd.DataFrame]:
     """Fetch DAPS tables if we don't have them already
     Args:
         table_name: name
-        path: path for the table
         fields: fields to fetch. If a list, fetches those
+        con: connection to read from. If None, connects using `MYSQL_CONFIG`
+        chunksize: number of rows per chunk. If None, it is chosen so that
+            chunks take up about `CHUNK_BYTES`
+        partitions: if given, the table is split into this many ranges of
+            `key` that are read concurrently on pooled connections to the
+            database of `con` (see `fetch_partitions`), one chunk per range
+        key: column to partition on
     Returns:
-        table
+        table chunks. The connection is only held while they are iterated
     """
+    if partitions is not None:
+        config_path = con.engine.url if con is not None else None
+        yield from fetch_partitions(
+            table_name, key, partitions, fields=fields, config_path=config_path
+        )
+        return
+
     logging.info(f"Fetching {table_name}")
-    engine = get_engine(MYSQL_CONFIG)
-    con = engine.connect().execution_options(stream_results=True)
+    with daps_connection(con) as con:
+        con = con.execution_options(stream_results=True)
 
-    if fields == "all":
-        chunks = pd.read_sql_table(table_name, con, chunksize=1000)
-    else:
-        chunks = pd.read_sql_table(table_name, con, columns=fields, chunksize=1000)
+        if chunksize is None:
+            table = reflect_daps_table(table_name, con)
+            cols = [table] if fields == "all" else [table.c[field] for field in fields]
+            chunksize = estimate_chunksize(select(cols), con)
+            logging.info(f"Fetching {table_name} in chunks of {chunksize} rows")
+
+        if fields == "all":
+            yield from pd.read_sql_table(table_name, con, chunksize=chunksize)
+        else:
+            yield from pd.read_sql_table(
+                table_name, con, columns=fields, chunksize=chunksize
+            )
+
+
+def fetch_daps_query(
+    query, con=None, chunksize: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """Stream the results of a query against DAPS
+    Args:
+        query: SQL string or SQLAlchemy selectable
+        con: connection to read from. If None, connects using `MYSQL_CONFIG`
+        chunksize: number of rows per chunk. If None, it is chosen so that
+            chunks take up about `CHUNK_BYTES` (`SAMPLE_ROWS` for SQL strings)
+    Returns:
+        query results
+    """
+    with daps_connection(con) as con:
+        con = con.execution_options(stream_results=True)
+
+        if chunksize is None:
+            chunksize = (
+                estimate_chunksize(query, con)
+                if isinstance(query, Select)
+                else SAMPLE_ROWS
+            )
+
+        yield from pd.read_sql_query(query, con, chunksize=chunksize)
+
+
+def prefetch_chunks(
+    df_iterator: Iterator[pd.DataFrame], max_prefetch: int = 2
+) -> Iterator[pd.DataFrame]:
+    """Fetch DataFrame chunks in a background thread
+
+    The next chunks are fetched while the current one is being consumed
+    (e.g. serialised to disk), so that network and disk I/O overlap.
+
+    Args:
+        df_iterator: DataFrame chunks
+        max_prefetch: maximum number of chunks fetched ahead
+    Returns:
+        the same chunks
+    """
+    chunks = Queue(maxsize=max_prefetch)
+    done = object()
+    stop = Event()
 
-    return chunks
+    def put(item) -> bool:
+        while stop.is_set() is False:
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for chunk in df_iterator:
+                if put(chunk) is False:
+                    return
+        except Exception as e:  # noqa: B902
+            put(e)
+        put(done)
+
+    thread = Thread(target=produce, daemon=True)
+    thread.start()
+
+    # If the consumer stops early, wait for the producer so that it isn't
+    # still reading from a connection that is about to be reused
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is done:
+                return
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        thread.join()
+
+
+def log_throughput(
+    df_iterator: Iterator[pd.DataFrame], name: str
+) -> Iterator[pd.DataFrame]:
+    """Log the rows/s at which DataFrame chunks are consumed
+    Args:
+        df_iterator: DataFrame chunks
+        name: name used in the log message
+    Returns:
+        the same chunks
+    """
+    n_rows = 0
+    start = time.perf_counter()
+    for chunk in df_iterator:
+        n_rows += len(chunk)
+        yield chunk
+
+    elapsed = time.perf_counter() - start
+    logging.info(
+        f"{name}: {n_rows} rows in {elapsed:.1f}s "
+        f"({n_rows / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+def filter_chunks(
+    df_iterator: Iterator[pd.DataFrame],
+    predicate: Optional[Callable[[pd.DataFrame], pd.Series]] = None,
+    columns: Optional[List[str]] = None,
+    unique_on: Optional[str] = None,
+) -> Iterator[pd.DataFrame]:
+    """Filter, project and de-duplicate DataFrame chunks as they stream
+
+    Only the ids seen so far are kept in memory, so peak memory is bounded by
+    the chunk size rather than the size of the table.
+
+    Args:
+        df_iterator: DataFrame chunks
+        predicate: function returning a boolean mask of the rows of a chunk
+            to keep
+        columns: columns to keep. If None, keeps all of them
+        unique_on: id column. Rows with an id seen before are dropped
+    Returns:
+        filtered chunks. Empty chunks are skipped, unless all of them are
+        empty, in which case one is returned so that the schema is kept.
+    """
+    seen = set()
+    n_yielded = 0
+    empty = None
+    for chunk in df_iterator:
+        if predicate is not None:
+            chunk = chunk.loc[predicate(chunk)]
+        if unique_on is not None:
+            ids = chunk[unique_on]
+            chunk = chunk.loc[~ids.isin(seen) & ~ids.duplicated()]
+            seen.update(chunk[unique_on])
+        if columns is not None:
+            chunk = chunk[columns]
+
+        if len(chunk) == 0:
+            empty = chunk
+            continue
+        n_yielded += 1
+        yield chunk
+
+    if n_yielded == 0 and empty is not None:
+        yield empty
+
+
+def reflect_daps_table(table_name: str, con=None) -> Table:
+    """Reflect a DAPS table so that it can be used to build queries
+    Args:
+        table_name: name
+        con: connection to reflect from. If None, connects using `MYSQL_CONFIG`
+    Returns:
+        table
+    """
+    return Table(
+        table_name,
+        MetaData(),
+        autoload=True,
+        autoload_with=con if con is not None else get_engine(MYSQL_CONFIG),
+    )
+
+
+def _open_compressed(path: str, compression: str):
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError("zstd compression requires `zstandard`")
+        return zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+    raise ValueError(f"Unknown compression {compression}")
+
+
+def _compress(data: bytes, compression: Optional[str]) -> bytes:
+    """Compress data as a complete gzip member or zstd frame
+
+    Both can be concatenated, so compressed pages can be appended to a file.
+    """
+    if compression is None:
+        return data
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=6)
+    if zstandard is None:
+        raise ImportError("zstd compression requires `zstandard`")
+    return zstandard.ZstdCompressor().compress(data)
+
+
+@contextmanager
+def compressed_writer(
+    path: str, compression: str, max_pending: int = 4
+) -> Iterator[Callable[[str], None]]:
+    """Open a compressed text file that is compressed in a background thread
+
+    Yields a function that queues text to be written, so that the caller
+    (e.g. fetching and rendering the next chunk) is not stalled by the
+    compression.
+
+    Args:
+        path: output file
+        compression: "gzip" or "zstd"
+        max_pending: maximum number of writes queued before the caller waits
+    """
+    pending = Queue(maxsize=max_pending)
+    errors = []
+
+    def compress():
+        try:
+            with _open_compressed(path, compression) as f:
+                for data in iter(pending.get, None):
+                    f.write(data.encode())
+        except Exception as e:  # noqa: B902
+            errors.append(e)
+            while pending.get() is not None:  # Don't block the caller
+                continue
+
+    thread = Thread(target=compress, daemon=True)
+    thread.start()
+    try:
+        yield pending.put
+    finally:
+        pending.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+
+@contextmanager
+def csv_source(path: str):
+    """Path or (for zstd) decompressed stream of a csv, to read with pandas"""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise ImportError("zstd compression requires `zstandard`")
+        with open(path, "rb") as f:
+            yield zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True)
+    else:  # Uncompressed or gzip
+        yield path
 
 
 def stream_df_to_csv(
     df_iterator: Iterator[pd.DataFrame],
     path_or_buf: Any,  # FilePathOrBuffer
+    compression: Optional[str] = None,
     **kwargs,
 ):
     """Stream a DataFrame iterator to csv.
@@ -59,6 +480,8 @@ def stream_df_to_csv(
     Args:
         df_iterator: DataFrame chunks to stream to CSV
         path_or_buf: FilePath or Buffer (passed to `DataFrame.to_csv`)
+        compression: "gzip" or "zstd" to compress the output (a file path)
+            in a background thread (see `compressed_writer`)
         kwargs: Extra args passed to `DataFrame.to_csv`. Cannot contain
             any of `{"mode", "header", "path_or_buf"}` - `mode` is "a" and
             `header` is `False` for all but initial chunks.
@@ -70,6 +493,12 @@ def stream_df_to_csv(
     if any((key in kwargs for key in ["mode", "header", "path_or_buf"])):
         raise ValueError()
 
+    if compression is not None:
+        with compressed_writer(path_or_buf, compression) as write:
+            for i, chunk in enumerate(df_iterator):
+                write(chunk.to_csv(header=i == 0, **kwargs))
+        return
+
     # First chunk: mode "w" and write column names
     initial = next(df_iterator)
     initial.to_csv(path_or_buf, **kwargs)
@@ -78,11 +507,803 @@ def stream_df_to_csv(
         chunk.to_csv(path_or_buf, mode="a", header=False, **kwargs)
 
 
-def save_daps_table(table: pd.DataFrame, name: str, path: str):
+def arrow_types(name: str, query: Optional[Select] = None) -> Dict[str, pa.DataType]:
+    """Arrow types of the columns of a DAPS table, from the SQL types of the
+    query it is read with and the dtypes declared in `schemas.DTYPES` (which
+    take precedence)
+    Args:
+        name: table name, or the name it is saved under
+        query: query the table is read with
+    Returns:
+        column to arrow type, for the columns whose type is known
+    """
+    types = {}
+    for col in [] if query is None else query.columns:
+        try:
+            python_type = col.type.python_type
+        except NotImplementedError:  # e.g. dialect-specific types
+            continue
+        if python_type in SQL_ARROW_TYPES:
+            types[col.name] = SQL_ARROW_TYPES[python_type]
+    for col, dtype in get_dtypes(name).items():
+        types[col] = DTYPE_ARROW_TYPES[dtype]
+    return types
+
+
+def stream_df_to_parquet(
+    df_iterator: Iterator[pd.DataFrame],
+    path: str,
+    schema: Optional[pa.Schema] = None,
+    types: Optional[Dict[str, pa.DataType]] = None,
+    compression: str = PARQUET_COMPRESSION,
+):
+    """Stream a DataFrame iterator to parquet, one row group per chunk.
+
+    Args:
+        df_iterator: DataFrame chunks to stream to parquet
+        path: output file
+        schema: arrow schema of the output. If None, it is built from `types`
+            and the columns of the first chunk
+        types: column to arrow type (see `arrow_types`). Other columns have
+            the type inferred from the first chunk. If they are all null
+            there, they are stored as strings (and later values cast to str)
+        compression: parquet compression codec
+    """
+    initial = next(df_iterator)
+    null_cols = []
+    if schema is None:
+        types = types or {}
+        schema = pa.Schema.from_pandas(initial, preserve_index=False)
+        for i, field in enumerate(schema):
+            if field.name in types:
+                schema = schema.set(i, field.with_type(types[field.name]))
+            elif pa.types.is_null(field.type):
+                schema = schema.set(i, field.with_type(pa.string()))
+                null_cols.append(field.name)
+
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for chunk in chain([initial], df_iterator):
+            chunk = cast_dtypes(chunk, dict.fromkeys(null_cols, "str"))
+            writer.write_table(
+                pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+            )
+
+
+def _save_csv(table: pd.DataFrame, path: str, compression: Optional[str] = None):
+    stream_df_to_csv(iter([table]), path, compression=compression, index=False)
+
+
+def _remove_table(path: str):
+    """Remove a saved table (a file, or a directory of parts)"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _save_parquet(
+    table: pd.DataFrame,
+    path: str,
+    schema: Optional[pa.Schema] = None,
+    partition_cols: Optional[List[str]] = None,
+):
+    _remove_table(path)  # Could be a directory of parts
+    table.to_parquet(
+        path,
+        index=False,
+        schema=schema,
+        partition_cols=partition_cols,
+        compression=PARQUET_COMPRESSION,
+    )
+
+
+def _stream_parquet(df_iterator: Iterator[pd.DataFrame], path: str, **kwargs):
+    _remove_table(path)  # Could be a directory of parts
+    stream_df_to_parquet(df_iterator, path, **kwargs)
+
+
+def _stream_csv(
+    df_iterator: Iterator[pd.DataFrame], path: str, compression: Optional[str] = None
+):
+    stream_df_to_csv(df_iterator, path, compression=compression, index=False)
+
+
+def _csv_writers(compression: Optional[str] = None) -> Tuple[Callable, Callable]:
+    return (
+        partial(_save_csv, compression=compression),
+        partial(_stream_csv, compression=compression),
+    )
+
+
+# Writers for each storage format: (save a DataFrame, stream DataFrame chunks)
+WRITERS = {
+    "csv": _csv_writers(),
+    **{fmt: _csv_writers(compression) for fmt, compression in CSV_COMPRESSION.items()},
+    "parquet": (_save_parquet, _stream_parquet),
+}
+
+
+def remove_stale_copies(name: str, path: str, fmt: str):
+    """Remove what a table saved in full replaces: its copies in formats
+    other than `fmt` (so that readers can't pick up a stale copy) and its
+    sync metadata (see `sync_daps_table`)
+    Args:
+        name: table name
+        path: directory where we store the table
+        fmt: format of the copy to keep (a key of `WRITERS`)
+    """
+    for other in WRITERS:
+        other_path = f"{path}/{name}.{other}"
+        if other == fmt or os.path.exists(other_path) is False:
+            continue
+        logging.info(f"Removing {other_path}, replaced by {name}.{fmt}")
+        _remove_table(other_path)
+    if os.path.exists(_sync_metadata_path(path, name)):
+        os.remove(_sync_metadata_path(path, name))
+
+
+def save_daps_table(
+    table: pd.DataFrame, name: str, path: str, fmt: str = STORAGE_FORMAT, **kwargs
+):
     """Save DAPS tables
     Args:
         table: table to save
         name: table name
         path: directory where we store the table
+        fmt: storage format (a key of `WRITERS`). Saved as `{path}/{name}.{fmt}`
+        kwargs: extra arguments for the writer, e.g. `schema` and
+            `partition_cols` for parquet
+
+    Columns are cast to the dtypes declared in `schemas.DTYPES`. Copies of
+    the table in other formats (and its sync metadata) are removed.
     """
-    table.to_csv(f"{path}/{name}.csv", index=False)
+    save, _ = WRITERS[fmt]
+    save(apply_schema(table, name), f"{path}/{name}.{fmt}", **kwargs)
+    remove_stale_copies(name, path, fmt)
+
+
+def stream_save_daps_table(
+    df_iterator: Iterator[pd.DataFrame],
+    name: str,
+    path: str,
+    fmt: str = STORAGE_FORMAT,
+    query: Optional[Select] = None,
+    **kwargs,
+):
+    """Stream DAPS table chunks to storage
+    Args:
+        df_iterator: DataFrame chunks to save
+        name: table name
+        path: directory where we store the table
+        fmt: storage format (a key of `WRITERS`). Saved as `{path}/{name}.{fmt}`
+        query: query the chunks are read with. For parquet, the types of its
+            columns are used in the schema (see `arrow_types`)
+        kwargs: extra arguments for the writer, e.g. `schema` for parquet
+
+    Chunks are fetched in a background thread while the previous ones are
+    written, and the throughput is logged. Columns are cast to the dtypes
+    declared in `schemas.DTYPES` (except categoricals, which could differ
+    between chunks). Copies of the table in other formats (and its sync
+    metadata) are removed.
+    """
+    _, stream = WRITERS[fmt]
+    if fmt == "parquet" and "schema" not in kwargs:
+        kwargs["types"] = arrow_types(name, query)
+    df_iterator = (
+        apply_schema(chunk, name, categorical=False) for chunk in df_iterator
+    )
+    stream(
+        log_throughput(prefetch_chunks(df_iterator), name),
+        f"{path}/{name}.{fmt}",
+        **kwargs,
+    )
+    remove_stale_copies(name, path, fmt)
+
+
+def key_boundaries(table_name: str, key: str, n_partitions: int, con=None) -> List[Any]:
+    """Split points dividing a table into key ranges of similar size
+
+    Numeric keys are split evenly between their min and max. Other keys
+    (e.g. uuids) are split at quantiles read off the (indexed) key column.
+
+    Args:
+        table_name: name of the DAPS table
+        key: column to partition on (ideally the primary key)
+        n_partitions: number of partitions
+        con: connection to read from
+    Returns:
+        sorted, distinct split points (at most `n_partitions - 1`)
+    """
+    with daps_connection(con) as con:
+        table = reflect_daps_table(table_name, con)
+        col = table.c[key]
+        lower, upper = con.execute(select([func.min(col), func.max(col)])).first()
+
+        if isinstance(lower, (int, float)) and isinstance(upper, (int, float)):
+            step = (upper - lower) / n_partitions
+            bounds = [lower + step * i for i in range(1, n_partitions)]
+        else:
+            n_rows = con.execute(select([func.count()]).select_from(table)).scalar()
+            bounds = [
+                con.execute(
+                    select([col])
+                    .where(col.isnot(None))
+                    .order_by(col)
+                    .offset(i * n_rows // n_partitions)
+                    .limit(1)
+                ).scalar()
+                for i in range(1, n_partitions)
+            ]
+
+    return sorted(set(b for b in bounds if b is not None))
+
+
+def partition_queries(
+    table_name: str,
+    key: str,
+    n_partitions: int,
+    fields="all",
+    con=None,
+    where: Optional[Callable[[Table], Any]] = None,
+) -> List[Select]:
+    """Queries reading a table in key ranges (see `key_boundaries`)
+
+    Rows with a null key are read by the first query.
+
+    Args:
+        table_name: name of the DAPS table
+        key: column to partition on
+        n_partitions: number of partitions
+        fields: fields to fetch. If a list, fetches those
+        con: connection to read from
+        where: function of the (reflected) table returning a condition on
+            the rows to read, e.g. `lambda orgs: orgs.c.country == "UK"`
+    Returns:
+        one query per partition, in key order
+    """
+    table = reflect_daps_table(table_name, con)
+    col = table.c[key]
+    cols = [table] if fields == "all" else [table.c[field] for field in fields]
+    query = select(cols) if where is None else select(cols).where(where(table))
+
+    bounds = [None] + key_boundaries(table_name, key, n_partitions, con) + [None]
+    queries = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        if lower is None and upper is None:
+            queries.append(query)
+        elif lower is None:
+            queries.append(query.where(or_(col < upper, col.is_(None))))
+        elif upper is None:
+            queries.append(query.where(col >= lower))
+        else:
+            queries.append(query.where(and_(col >= lower, col < upper)))
+    return queries
+
+
+def fetch_partitions(
+    table_name: str,
+    key: str = "id",
+    n_partitions: int = 8,
+    max_workers: int = 4,
+    fields="all",
+    config_path=None,
+    where: Optional[Callable[[Table], Any]] = None,
+) -> Iterator[pd.DataFrame]:
+    """Fetch a DAPS table by reading key ranges concurrently
+
+    Each partition is read on its own pooled connection.
+
+    Args:
+        table_name: name of the DAPS table
+        key: column to partition on
+        n_partitions: number of partitions
+        max_workers: number of partitions read at the same time
+        fields: fields to fetch. If a list, fetches those
+        config_path: config path or URL (see `get_engine`). If None, uses
+            `MYSQL_CONFIG`
+        where: condition on the rows to read (see `partition_queries`)
+    Returns:
+        one DataFrame per partition, in key order
+    """
+    with daps_connection(config_path=config_path) as con:
+        queries = partition_queries(table_name, key, n_partitions, fields, con, where)
+
+    def fetch(query):
+        with daps_connection(config_path=config_path) as con:
+            return pd.concat(fetch_daps_query(query, con), ignore_index=True)
+
+    logging.info(f"Fetching {table_name} in {len(queries)} partitions")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(fetch, queries)
+
+
+def fetch_daps_table_partitioned(
+    table_name: str,
+    key: str = "id",
+    n_partitions: int = 8,
+    max_workers: int = 4,
+    fields="all",
+    config_path=None,
+) -> pd.DataFrame:
+    """Fetch a DAPS table by reading key ranges concurrently (see
+    `fetch_partitions` for the arguments)
+
+    Returns:
+        table, with partitions in key order
+    """
+    partitions = fetch_partitions(
+        table_name, key, n_partitions, max_workers, fields, config_path
+    )
+    table = pd.concat(partitions, ignore_index=True)
+    return apply_schema(table, table_name)
+
+
+def fetch_save_daps_table_partitioned(
+    table_name: str,
+    name: str,
+    path: str,
+    key: str = "id",
+    n_partitions: int = 8,
+    max_workers: int = 4,
+    fields="all",
+    config_path=None,
+    where: Optional[Callable[[Table], Any]] = None,
+    unique: bool = False,
+):
+    """Fetch a DAPS table by key range and save one parquet file per range
+
+    Partitions are streamed concurrently to
+    `{path}/{name}.parquet/part-{i}.parquet`, which `get_daps_table` reads
+    as a single table. Copies of the table in other formats (and its sync
+    metadata) are removed.
+
+    Args:
+        table_name: name of the DAPS table
+        name: name to save the table under
+        path: directory where we store the table
+        key: column to partition on
+        n_partitions: number of partitions
+        max_workers: number of partitions read at the same time
+        fields: fields to fetch. If a list, fetches those
+        config_path: config path or URL (see `get_engine`). If None, uses
+            `MYSQL_CONFIG`
+        where: condition on the rows to read (see `partition_queries`)
+        unique: whether to drop rows with a key seen before. Partitions are
+            disjoint key ranges, so rows are unique across the table
+    """
+    with daps_connection(config_path=config_path) as con:
+        queries = partition_queries(table_name, key, n_partitions, fields, con, where)
+
+    table_path = f"{path}/{name}.parquet"
+    _remove_table(table_path)
+    os.makedirs(table_path)
+
+    # Parts share the types of the query's columns, so they can be read as
+    # one table even if a column is all null in some of them
+    types = arrow_types(name, queries[0])
+
+    def fetch_save(i_query):
+        i, query = i_query
+        with daps_connection(config_path=config_path) as con:
+            chunks = fetch_daps_query(query, con)
+            if unique is True:
+                chunks = filter_chunks(chunks, unique_on=key)
+            chunks = (apply_schema(chunk, name, categorical=False) for chunk in chunks)
+            stream_df_to_parquet(
+                chunks, f"{table_path}/part-{i:05d}.parquet", types=types
+            )
+
+    logging.info(f"Fetching {table_name} in {len(queries)} partitions")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(fetch_save, enumerate(queries)))
+    remove_stale_copies(name, path, "parquet")
+
+
+def keyset_pages(
+    table_name: str,
+    key: str,
+    page_size: int,
+    after: Any = None,
+    fields="all",
+    con=None,
+) -> Iterator[pd.DataFrame]:
+    """Page through a DAPS table in key order using keyset pagination
+
+    Each page is read with `WHERE key > last_key ORDER BY key LIMIT n`
+    (rather than `OFFSET`), so it costs the same wherever it is in the
+    table. The key does not need to be unique: rows sharing the last key of
+    a page are moved to the next one so that pages end on a complete key.
+
+    Args:
+        table_name: name of the DAPS table
+        key: column to page on (ideally the primary key)
+        page_size: rows per page
+        after: only read rows with a key greater than this
+        fields: fields to fetch. If a list, fetches those
+        con: connection to read from
+    Returns:
+        pages in key order
+    """
+    with daps_connection(con) as con:
+        table = reflect_daps_table(table_name, con)
+        col = table.c[key]
+        cols = [table] if fields == "all" else [table.c[field] for field in fields]
+        if fields != "all" and key not in fields:
+            cols.append(col)
+
+        while True:
+            query = select(cols).where(col.isnot(None)).order_by(col).limit(page_size)
+            if after is not None:
+                query = query.where(col > after)
+            page = pd.read_sql_query(query, con)
+
+            if len(page) == page_size:
+                last = page[key].iloc[-1]
+                complete = page.loc[page[key] != last]
+                if len(complete) == 0:  # A single key spans the whole page
+                    complete = pd.read_sql_query(select(cols).where(col == last), con)
+                page = complete
+            if len(page) == 0:
+                return
+
+            yield page
+            after = page[key].iloc[-1]
+            if isinstance(after, np.generic):  # Database drivers bind Python types
+                after = after.item()
+
+
+def part_number(filename: str) -> Optional[int]:
+    """Number of a part file (`part-{i}.parquet`), or None for other files"""
+    match = PART_PATTERN.match(filename)
+    return int(match.group(1)) if match else None
+
+
+def _write_checkpoint(checkpoint_path: str, checkpoint: Dict[str, Any]):
+    """Atomically write an extraction checkpoint"""
+    with open(f"{checkpoint_path}.tmp", "w") as outfile:
+        json.dump(checkpoint, outfile, default=str)
+    os.replace(f"{checkpoint_path}.tmp", checkpoint_path)
+
+
+def _as_param(value: Any) -> Any:
+    """Value as a Python type that database drivers (and JSON) can take"""
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _write_page_and_checkpoint(
+    page: pd.DataFrame,
+    name: str,
+    table_path: str,
+    fmt: str,
+    types: Dict[str, pa.DataType],
+    checkpoint_path: str,
+    checkpoint: Dict[str, Any],
+    **progress,
+):
+    """Append a page to a stored table, then checkpoint the end of the output
+    (and `progress`, e.g. the last key read)
+
+    The page is written (and fsynced) before the checkpoint, so that a
+    checkpoint never points past the output it describes. Parquet pages are
+    written to the next part file (`checkpoint["parts"]`), and csv pages
+    appended as a compressed member (ending at `checkpoint["offset"]`).
+    """
+    page = apply_schema(page, name, categorical=False)
+    if fmt == "parquet":
+        stream_df_to_parquet(
+            iter([page]),
+            f"{table_path}/part-{checkpoint['parts']:05d}.parquet",
+            types=types,
+        )
+        checkpoint["parts"] += 1
+    else:
+        with open(table_path, "ab") as f:
+            data = page.to_csv(index=False, header=f.tell() == 0).encode()
+            f.write(_compress(data, CSV_COMPRESSION.get(fmt)))
+            f.flush()
+            os.fsync(f.fileno())
+            checkpoint["offset"] = f.tell()
+
+    checkpoint.update(progress)
+    _write_checkpoint(checkpoint_path, checkpoint)
+
+
+def extract_resumable(
+    table_name: str,
+    name: str,
+    path: str,
+    key: str = "id",
+    page_size: Optional[int] = None,
+    fmt: str = STORAGE_FORMAT,
+    fields="all",
+    con=None,
+):
+    """Extract a DAPS table so that a failed extraction can be resumed
+
+    The table is read with `keyset_pages`. After each page is written, the
+    last key (and, for csv, the byte offset of the output) is checkpointed
+    in `{path}/{name}.{fmt}.checkpoint.json`. If a checkpoint exists, output
+    written after it is discarded and the extraction continues from its
+    key. The checkpoint (and copies of the table in other formats, and its
+    sync metadata) are removed once the table has been extracted.
+
+    Args:
+        table_name: name of the DAPS table
+        name: name to save the table under
+        path: directory where we store the table
+        key: column to page on (see `keyset_pages`)
+        page_size: rows per page. If None, it is chosen so that pages take
+            up about `CHUNK_BYTES`
+        fmt: "csv" (a single file, with one compressed member per page for
+            "csv.gz" and "csv.zst") or "parquet" (one file per page in
+            `{path}/{name}.parquet/`)
+        fields: fields to fetch. If a list, fetches those
+        con: connection to read from
+    """
+    table_path = f"{path}/{name}.{fmt}"
+    checkpoint_path = f"{table_path}.checkpoint.json"
+
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as infile:
+            checkpoint = json.load(infile)
+        logging.info(f"Resuming {table_name} from {key} > {checkpoint['last_key']}")
+    else:
+        checkpoint = {"last_key": None, "offset": 0, "parts": 0, "rows": 0}
+
+    if fmt == "csv" or fmt in CSV_COMPRESSION:
+        if os.path.exists(table_path):
+            with open(table_path, "r+b") as f:
+                f.truncate(checkpoint["offset"])
+    elif fmt == "parquet":
+        if checkpoint["last_key"] is None or os.path.isfile(table_path):
+            _remove_table(table_path)
+        os.makedirs(table_path, exist_ok=True)
+        for part in os.listdir(table_path):
+            number = part_number(part)
+            if number is not None and number >= checkpoint["parts"]:
+                os.remove(f"{table_path}/{part}")
+    else:
+        raise ValueError(f"Can't extract {table_name} to {fmt}")
+
+    with daps_connection(con) as con:
+        table = reflect_daps_table(table_name, con)
+        cols = [table] if fields == "all" else [table.c[f] for f in fields]
+        types = arrow_types(name, select(cols))
+        if page_size is None:
+            page_size = estimate_chunksize(select(cols), con)
+
+        pages = prefetch_chunks(
+            keyset_pages(
+                table_name, key, page_size, checkpoint["last_key"], fields, con
+            )
+        )
+        try:
+            for page in log_throughput(pages, name):
+                # Checkpoint the key as read so it compares correctly in the database
+                _write_page_and_checkpoint(
+                    page,
+                    name,
+                    table_path,
+                    fmt,
+                    types,
+                    checkpoint_path,
+                    checkpoint,
+                    last_key=_as_param(page[key].iloc[-1]),
+                    rows=checkpoint["rows"] + len(page),
+                )
+        finally:
+            pages.close()
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    remove_stale_copies(name, path, fmt)
+
+
+def _sync_metadata_path(path: str, name: str) -> str:
+    return f"{path}/{name}.sync.json"
+
+
+def get_sync_metadata(name: str, path: str) -> Optional[Dict[str, Any]]:
+    """Read the sync metadata stored next to a local copy of a DAPS table
+    Args:
+        name: table name
+        path: directory where we store the table
+    Returns:
+        The metadata, or None if the table has never been synced (or was
+        saved in full since)
+    """
+    meta_path = _sync_metadata_path(path, name)
+    if os.path.exists(meta_path) is False:
+        return None
+    with open(meta_path, "r") as infile:
+        return json.load(infile)
+
+
+def stored_format(name: str, path: str) -> Optional[str]:
+    """Format of the newest stored copy of a table (None if there is none)
+
+    Writers remove the other copies of a table, but an interrupted write
+    (or an older version) can leave them behind. Between copies saved at
+    the same time, parquet is preferred, then compressed csv.
+    """
+    formats = reversed(list(WRITERS))
+    stored = [fmt for fmt in formats if os.path.exists(f"{path}/{name}.{fmt}")]
+    if len(stored) == 0:
+        return None
+    return max(stored, key=lambda fmt: _mtime(f"{path}/{name}.{fmt}"))
+
+
+def _mtime(path: str) -> float:
+    """Modification time of a file, or of the newest file in a directory"""
+    if os.path.isdir(path):
+        entries = [f"{path}/{entry}" for entry in os.listdir(path)]
+        return max(map(os.path.getmtime, [path] + entries))
+    return os.path.getmtime(path)
+
+
+def _max_value(table_path: str, fmt: str, column: str) -> Any:
+    """Largest value of a column of a stored table"""
+    if fmt == "parquet":
+        values = pd.read_parquet(table_path, columns=[column])[column]
+    else:
+        with csv_source(table_path) as source:
+            values = pd.read_csv(source, usecols=[column])[column]
+    return values.max()
+
+
+def _start_sync(
+    table_path: str, fmt: str, meta: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Discard output written after the last sync checkpoint (and, for
+    parquet, turn a single-file copy into parts)
+    Returns:
+        position to append at: `offset` (csv) or next part number (parquet)
+    """
+    if fmt == "parquet":
+        if os.path.isfile(table_path):
+            os.replace(table_path, f"{table_path}.tmp")
+            os.makedirs(table_path)
+            os.replace(f"{table_path}.tmp", f"{table_path}/part-00000.parquet")
+        os.makedirs(table_path, exist_ok=True)
+        numbers = [part_number(part) for part in os.listdir(table_path)]
+        numbers = [number for number in numbers if number is not None]
+        parts = meta["parts"] if meta is not None else max(numbers, default=-1) + 1
+        for number in numbers:
+            if number >= parts:
+                os.remove(f"{table_path}/part-{number:05d}.parquet")
+        return {"parts": parts}
+
+    if fmt != "csv" and fmt not in CSV_COMPRESSION:
+        raise ValueError(f"Can't sync to {fmt}")
+    if os.path.exists(table_path) is False:
+        return {"offset": 0}
+    if meta is None:
+        return {"offset": os.path.getsize(table_path)}
+    with open(table_path, "r+b") as f:
+        f.truncate(meta["offset"])
+    return {"offset": meta["offset"]}
+
+
+def _complete_batches(
+    chunks: Iterator[pd.DataFrame], watermark_col: str
+) -> Iterator[pd.DataFrame]:
+    """Re-chunk rows ordered by a watermark so that chunks end on a complete
+    watermark value (rows sharing the last value of a chunk are moved to
+    the next one), so that resuming after a chunk's watermark misses no rows
+    """
+    carry = None
+    for chunk in chunks:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        if len(chunk) == 0:
+            continue
+        last = chunk[watermark_col].iloc[-1]
+        carry = chunk.loc[chunk[watermark_col] == last]
+        complete = chunk.loc[chunk[watermark_col] != last]
+        if len(complete) > 0:
+            yield complete
+    if carry is not None and len(carry) > 0:
+        yield carry
+
+
+def sync_daps_table(
+    table_name: str,
+    path: str,
+    watermark_col: str,
+    name: Optional[str] = None,
+    key: Optional[List[str]] = None,
+    query: Optional[Select] = None,
+    fmt: str = STORAGE_FORMAT,
+    con=None,
+    chunksize: Optional[int] = None,
+) -> int:
+    """Incrementally sync a DAPS table to `{path}/{name}.{fmt}`
+
+    Only rows where `watermark_col` (e.g. an auto-increment id or an
+    `updated_at` timestamp) is past the watermark recorded by the previous
+    sync are fetched (rows where it is null are never fetched). If there is
+    no sync metadata but a local copy exists, the watermark is taken from
+    the copy.
+
+    Fetched rows are appended to the copy: csv copies get a compressed
+    member per chunk, and parquet copies a file per chunk in
+    `{path}/{name}.parquet/`. After each chunk, the watermark and the end of
+    the output are checkpointed in `{path}/{name}.sync.json`, so an
+    interrupted sync discards the output written after its last checkpoint
+    and carries on from there.
+
+    Args:
+        table_name: name of the DAPS table
+        path: directory where we store the table
+        watermark_col: monotonically increasing column to sync on
+        name: name of the local copy. Defaults to `table_name`
+        key: columns identifying a row. If given, fetched rows are appended
+            as new versions of the rows with the same key, and
+            `get_daps_table` keeps the last version of each key (upsert)
+        query: query for the rows to sync (e.g. of a subset of the table).
+            Defaults to all of the table
+        fmt: storage format (a key of `WRITERS`) if there is no local copy.
+            Otherwise the copy's format is kept
+        con: connection to read from. If None, connects using `MYSQL_CONFIG`
+        chunksize: number of rows per fetched chunk (see `fetch_daps_query`)
+    Returns:
+        Number of rows fetched
+    """
+    name = name or table_name
+    fmt = stored_format(name, path) or fmt
+    table_path = f"{path}/{name}.{fmt}"
+    meta_path = _sync_metadata_path(path, name)
+    meta = get_sync_metadata(name, path)
+    if meta is not None and meta.get("format") != fmt:
+        meta = None  # Describes a copy that has since been replaced
+
+    if meta is not None:
+        watermark = meta["watermark"]
+    elif os.path.exists(table_path):
+        watermark = _as_param(_max_value(table_path, fmt, watermark_col))
+    else:
+        watermark = None
+
+    os.makedirs(path, exist_ok=True)
+    meta = {
+        "table_name": table_name,
+        "watermark_col": watermark_col,
+        "watermark": None if pd.isnull(watermark) else watermark,
+        "key": key,
+        "format": fmt,
+        "rows_fetched": 0,
+        **_start_sync(table_path, fmt, meta),
+    }
+    _write_checkpoint(meta_path, meta)
+
+    with daps_connection(con) as con:
+        if query is None:
+            query = select([reflect_daps_table(table_name, con)])
+        types = arrow_types(name, query)
+        col = column(watermark_col)
+        query = query.where(col.isnot(None)).order_by(col)
+        if meta["watermark"] is not None:
+            query = query.where(col > meta["watermark"])
+
+        logging.info(f"Syncing {table_name} from {watermark_col} > {watermark}")
+        chunks = fetch_daps_query(query, con, chunksize)
+        for chunk in _complete_batches(chunks, watermark_col):
+            # Checkpoint the watermark as read so it compares correctly in
+            # the database
+            _write_page_and_checkpoint(
+                chunk,
+                name,
+                table_path,
+                fmt,
+                types,
+                meta_path,
+                meta,
+                watermark=_as_param(chunk[watermark_col].iloc[-1]),
+                rows_fetched=meta["rows_fetched"] + len(chunk),
+                synced_at=datetime.utcnow().isoformat(),
+            )
+
+    logging.info(f"Fetched {meta['rows_fetched']} new rows from {table_name}")
+    return meta["rows_fetched"]
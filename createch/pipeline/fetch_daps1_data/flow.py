@@ -2,6 +2,15 @@
 
 GtR and Crunchbase data pipeline currently reside `nestauk/nesta`.
 fetched using the `nestauk/data_getters` internal library.
+
+Each table is fetched in its own branch (with its own database connection)
+so that the extracts run concurrently. `db-config-path` can also be a
+SQLAlchemy URL (e.g. `sqlite:///daps.db`) to run against a local stand-in.
+The largest tables (the GtR link table and Crunchbase organisations) can be
+read in `partitions` key ranges at once, instead of in one query (for
+Crunchbase) or resumably by pages (for GtR). With `incremental`, Crunchbase
+organisations and funding rounds are synced from their update timestamps
+instead (GtR tables have no such column, so they are always read in full).
 """
 import os
 
@@ -10,61 +19,158 @@ from metaflow import conda_base, FlowSpec, Parameter, step
 
 ENV_VAR = "MYSQL_CONFIG"
 
-LIBRARIES = {"pymysql": "0.9.3", "sqlalchemy": "1.3.4", "pandas": ">1"}
+LIBRARIES = {
+    "pymysql": "0.9.3",
+    "sqlalchemy": "1.3.4",
+    "pandas": ">1",
+    "pyarrow": ">=1",
+    "zstandard": ">=0.15",
+}
 
 
 @conda_base(python="3.7", libraries=LIBRARIES)
 class CreatechNestaGetter(FlowSpec):
 
     db_config_path = Parameter("db-config-path", type=str, default=os.getenv(ENV_VAR))
+    partitions = Parameter(
+        "partitions",
+        type=int,
+        default=0,
+        help="Number of key ranges the GtR link table and Crunchbase "
+        "organisations are read in concurrently. By default (0), organisations "
+        "are read in one query and the link table resumably by pages",
+    )
+    incremental = Parameter(
+        "incremental",
+        type=bool,
+        default=False,
+        help="Only fetch the Crunchbase organisations and funding rounds "
+        "updated since the last run, and merge them into the saved tables",
+    )
 
     @step
     def start(self):
-        self.next(self.fetch_names)
+        """Check the database config and fan out to one branch per table."""
+        if self.db_config_path is None:
+            raise ValueError(
+                f"`db_config_path` was not set. Pass in a config path as a "
+                f"flow argument or set {ENV_VAR} env variable."
+            )
+
+        self.next(
+            self.fetch_names,
+            self.fetch_cb_orgs,
+            self.fetch_cb_funding_rounds,
+            self.fetch_cb_orgs_cats,
+            self.fetch_cb_category_groups,
+            self.fetch_gtr_funds,
+            self.fetch_gtr_topic,
+            self.fetch_gtr_link_table,
+            self.fetch_gtr_projects,
+        )
+
+    def _connect(self):
+        """Open a new connection to the DAPS database."""
+        from daps1_utils import get_engine
+
+        return get_engine(self.db_config_path).connect()
 
     @step
     def fetch_names(self):
         """Fetch Organisation (GtR & crunchbase) names."""
-        from daps1_utils import get_engine
         from gtr_utils import get_names as get_gtr_names
         from cb_utils import get_uk_names as get_cb_names
 
-        if self.db_config_path is None:
-            raise ValueError(
-                f"`db_config_path` was not set. Pass in a config path as a "
-                f"flow argument or set {ENV_VAR} env variable."
-            )
+        with self._connect() as con:
+            self.gtr_names = get_gtr_names(con)
+            self.crunchbase_names = get_cb_names(con)
 
-        engine = get_engine(self.db_config_path)
-        con = engine.connect()
+        self.next(self.join)
+
+    @step
+    def fetch_cb_orgs(self):
+        """Fetch UK Crunchbase organisations."""
+        from cb_utils import CB_PATH, fetch_save_cb_orgs
 
-        self.gtr_names = get_gtr_names(con)
-        self.crunchbase_names = get_cb_names(con)
+        os.makedirs(CB_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_cb_orgs(con, self.partitions or None, self.incremental)
 
-        self.next(self.fetch_cb)
+        self.next(self.join)
 
     @step
-    def fetch_cb(self):
-        """Fetch Crunchbase tables."""
-        from cb_utils import CB_PATH, fetch_save_crunchbase
+    def fetch_cb_funding_rounds(self):
+        """Fetch Crunchbase funding rounds of UK organisations."""
+        from cb_utils import CB_PATH, fetch_save_cb_funding_rounds
 
-        if os.path.exists(CB_PATH) is False:
-            os.makedirs(CB_PATH)
+        os.makedirs(CB_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_cb_funding_rounds(con, incremental=self.incremental)
 
-        fetch_save_crunchbase()
+        self.next(self.join)
 
-        self.next(self.fetch_gtr)
+    @step
+    def fetch_cb_orgs_cats(self):
+        """Fetch Crunchbase categories of UK organisations."""
+        from cb_utils import CB_PATH, fetch_save_cb_orgs_cats
+
+        os.makedirs(CB_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_cb_orgs_cats(con)
+
+        self.next(self.join)
+
+    @step
+    def fetch_cb_category_groups(self):
+        """Fetch Crunchbase category groups."""
+        from cb_utils import CB_PATH, fetch_save_cb_category_groups
+
+        os.makedirs(CB_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_cb_category_groups(con)
+
+        self.next(self.join)
+
+    @step
+    def fetch_gtr_funds(self):
+        """Fetch GtR funds."""
+        self._fetch_gtr_table("gtr_funds")
+        self.next(self.join)
+
+    @step
+    def fetch_gtr_topic(self):
+        """Fetch GtR topics."""
+        self._fetch_gtr_table("gtr_topic")
+        self.next(self.join)
+
+    @step
+    def fetch_gtr_link_table(self):
+        """Fetch GtR link table."""
+        self._fetch_gtr_table("gtr_link_table", self.partitions or None)
+        self.next(self.join)
+
+    def _fetch_gtr_table(self, table_name, partitions=None):
+        from gtr_utils import GTR_PATH, fetch_save_gtr_table
+
+        os.makedirs(GTR_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_gtr_table(table_name, con, partitions)
 
     @step
-    def fetch_gtr(self):
-        """Fetch GtR tables."""
-        from gtr_utils import GTR_PATH, fetch_save_gtr_tables
+    def fetch_gtr_projects(self):
+        """Fetch GtR projects funded from 2006."""
+        from gtr_utils import GTR_PATH, fetch_save_gtr_projects
 
-        if os.path.exists(GTR_PATH) is False:
-            os.mkdir(GTR_PATH)
+        os.makedirs(GTR_PATH, exist_ok=True)
+        with self._connect() as con:
+            fetch_save_gtr_projects(con)
 
-        fetch_save_gtr_tables()
+        self.next(self.join)
 
+    @step
+    def join(self, inputs):
+        """Collect the organisation names from the `fetch_names` branch."""
+        self.merge_artifacts(inputs)
         self.next(self.end)
 
     @step
@@ -1,16 +1,22 @@
 # Fetch GtR tables
 # TODO: Add organisations and funding tables
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, Iterator
+from typing import Dict, Iterator, Optional
 
 import pandas as pd
+from sqlalchemy import and_, func, select
+from sqlalchemy.sql import Select
 
 from daps1_utils import (
-    get_engine,
-    fetch_daps_table,
-    MYSQL_CONFIG,
-    stream_df_to_csv,
+    daps_connection,
+    extract_resumable,
+    fetch_daps_query,
+    fetch_save_daps_table_partitioned,
+    reflect_daps_table,
+    stream_save_daps_table,
 )
 
 logger = logging.getLogger(__name__)
@@ -19,56 +25,168 @@ logger = logging.getLogger(__name__)
 GTR_PATH = Path(__file__).parents[3] / "inputs/data/gtr"
 
 
-def projects_funded_from_2006() -> Iterator[pd.DataFrame]:
-    """GtR projects with funding starting from 2006.
+# Project fields saved with the start of their earliest fund
+PROJECT_FIELDS = [
+    "title",
+    "grantCategory",
+    "leadFunder",
+    "abstractText",
+    "potentialImpact",
+    "techAbstractText",
+]
+
+# Projects are saved if they have funds starting from this date
+PROJECTS_START = datetime(2007, 1, 1)
+
+
+def gtr_projects_query(
+    start: Optional[datetime] = None, end: Optional[datetime] = None, con=None
+) -> Select:
+    """Query for GtR projects with the start of their earliest fund in a window
+
+    The window is applied as a range predicate on `gtr_funds.start` (rather
+    than a function of it) so that an index on `start` can be used, and
+    the earliest fund of each project is found before joining projects.
+
+    Args:
+        start: only include funds starting on or after this date
+        end: only include funds starting before this date
+        con: connection used to reflect the tables
+    Returns:
+        query with `project_id`, `PROJECT_FIELDS` and `start` (of the
+        earliest fund in the window)
+    """
+    projects = reflect_daps_table("gtr_projects", con)
+    links = reflect_daps_table("gtr_link_table", con)
+    funds = reflect_daps_table("gtr_funds", con)
+
+    conditions = [links.c.table_name == "gtr_funds"]
+    if start is not None:
+        conditions.append(funds.c.start >= start)
+    if end is not None:
+        conditions.append(funds.c.start < end)
+
+    first_funds = (
+        select([links.c.project_id, func.min(funds.c.start).label("start")])
+        .select_from(links.join(funds, links.c.id == funds.c.id))
+        .where(and_(*conditions))
+        .group_by(links.c.project_id)
+        .alias("first_funds")
+    )
+    return select(
+        [projects.c.id.label("project_id")]
+        + [projects.c[field] for field in PROJECT_FIELDS]
+        + [first_funds.c.start]
+    ).select_from(projects.join(first_funds, first_funds.c.project_id == projects.c.id))
+
+
+def projects_funded_from_2006(con=None) -> Iterator[pd.DataFrame]:
+    """GtR projects with funding starting after 2006.
+
+    Args:
+        con: connection to read from. If None, connects using `MYSQL_CONFIG`
 
     Returns:
         Iterable of query results
     """
-    engine = get_engine(MYSQL_CONFIG)
-    con = engine.connect().execution_options(stream_results=True)
-    query = """
-    SELECT
-        DISTINCT gtr_projects.id AS project_id,
-        gtr_projects.title,
-        gtr_projects.grantCategory,
-        gtr_projects.leadFunder,
-        gtr_projects.abstractText,
-        gtr_projects.potentialImpact,
-        gtr_projects.techAbstractText,
-        gtr_funds.start
-    FROM
-        gtr_projects
-            INNER JOIN
-                (SELECT * FROM gtr_link_table
-                 WHERE gtr_link_table.table_name = 'gtr_funds')
-                AS l
-                ON l.project_id = gtr_projects.id
-            INNER JOIN
-                (SELECT * FROM gtr_funds
-                 WHERE YEAR(gtr_funds.start) > 2006)
-                AS gtr_funds
-                ON l.id = gtr_funds.id
-    GROUP BY gtr_projects.id HAVING MIN(YEAR(gtr_funds.start));
+    with daps_connection(con) as con:
+        yield from fetch_daps_query(gtr_projects_query(PROJECTS_START, con=con), con)
+
+
+def fetch_gtr_projects_by_year(
+    first_year: int = PROJECTS_START.year,
+    last_year: Optional[int] = None,
+    max_workers: int = 4,
+    config_path=None,
+) -> pd.DataFrame:
+    """Fetch GtR projects funded in a range of years, one year per query
+
+    Years are read concurrently, each on its own pooled connection. A
+    project funded in several years is kept with its earliest fund.
+
+    Args:
+        first_year: first year of funding
+        last_year: last year of funding. If None, the current year
+        max_workers: number of years read at the same time
+        config_path: config path or URL (see `daps1_utils.get_engine`)
+    Returns:
+        projects, as in `gtr_projects_query`
     """
+    last_year = datetime.now().year if last_year is None else last_year
+
+    def fetch(year):
+        with daps_connection(config_path=config_path) as con:
+            query = gtr_projects_query(
+                datetime(year, 1, 1), datetime(year + 1, 1, 1), con
+            )
+            return pd.concat(fetch_daps_query(query, con))
+
+    logging.info(f"Fetching GtR projects funded in {first_year}-{last_year}")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        years = executor.map(fetch, range(first_year, last_year + 1))
+        projects = pd.concat(years, ignore_index=True)
+    return projects.drop_duplicates("project_id").reset_index(drop=True)
+
 
-    return pd.read_sql_query(query, con, chunksize=1000)
+# Lookup between DAPS GtR tables and the names we save them under
+GTR_TABLES = {
+    "gtr_funds": "gtr_funds",
+    "gtr_topic": "gtr_topics",
+    "gtr_link_table": "gtr_link_table",
+}
 
 
-def fetch_save_gtr_tables():
+# Keys to page through GtR tables on, or to split them into key ranges
+GTR_KEYS = {"gtr_funds": "id", "gtr_topic": "id", "gtr_link_table": "id"}
 
-    funders = fetch_daps_table("gtr_funds")
-    stream_df_to_csv(funders, path_or_buf=f"{GTR_PATH}/gtr_funds.csv", index=False)
 
-    topics = fetch_daps_table("gtr_topic")
-    stream_df_to_csv(topics, f"{GTR_PATH}/gtr_topics.csv", index=False)
+def fetch_save_gtr_table(table_name: str, con=None, partitions: Optional[int] = None):
+    """Extract a GtR table to storage
 
-    link = fetch_daps_table("gtr_link_table")
-    stream_df_to_csv(link, f"{GTR_PATH}/gtr_link_table.csv", index=False)
+    By default the table is extracted with `extract_resumable`, so an
+    interrupted extraction continues where it stopped when re-run. If
+    `partitions` is given, that many key ranges are instead read
+    concurrently (with pooled connections rather than `con`) and saved as
+    parquet. That can't be resumed, and splitting non-numeric keys (like
+    uuids) into ranges scans the key column once per range.
 
+    Args:
+        table_name: name of the DAPS table (a key of `GTR_TABLES`)
+        con: connection to read from
+        partitions: number of key ranges to read concurrently
+    """
+    if partitions is not None:
+        fetch_save_daps_table_partitioned(
+            table_name,
+            GTR_TABLES[table_name],
+            GTR_PATH,
+            key=GTR_KEYS[table_name],
+            n_partitions=partitions,
+            config_path=con.engine.url if con is not None else None,
+        )
+    else:
+        extract_resumable(
+            table_name, GTR_TABLES[table_name], GTR_PATH, GTR_KEYS[table_name], con=con
+        )
+
+
+def fetch_save_gtr_projects(
+    con=None, start: Optional[datetime] = PROJECTS_START, end: Optional[datetime] = None
+):
+    """Stream GtR projects funded in a window (by default, after 2006) to storage"""
     logging.info("Filtering projects...")
-    projects_filtered = projects_funded_from_2006()
-    stream_df_to_csv(projects_filtered, f"{GTR_PATH}/gtr_projects.csv", index=False)
+    with daps_connection(con) as con:
+        query = gtr_projects_query(start, end, con)
+        projects_filtered = fetch_daps_query(query, con)
+        stream_save_daps_table(projects_filtered, "gtr_projects", GTR_PATH, query=query)
+
+
+def fetch_save_gtr_tables(con=None):
+
+    for table_name in GTR_TABLES:
+        fetch_save_gtr_table(table_name, con)
+
+    fetch_save_gtr_projects(con)
 
 
 def get_names(con) -> Dict[str, str]:
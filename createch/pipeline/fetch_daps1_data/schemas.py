@@ -0,0 +1,139 @@
+# Declared dtypes for the DAPS tables we fetch
+from typing import Dict
+
+import pandas as pd
+
+# Repeated strings are categoricals, ids and free text are strings (`str`
+# keeps missing values as NaN), counts are nullable ints
+DTYPES = {
+    "gtr_projects": {
+        "project_id": "str",
+        "title": "str",
+        "grantCategory": "category",
+        "leadFunder": "category",
+        "abstractText": "str",
+        "potentialImpact": "str",
+        "techAbstractText": "str",
+        "start": "datetime64[ns]",
+    },
+    "gtr_funds": {
+        "id": "str",
+        "start": "datetime64[ns]",
+        "end": "datetime64[ns]",
+        "category": "category",
+        "amount": "float64",
+        "currencyCode": "category",
+    },
+    "gtr_topic": {"id": "str", "text": "str", "topic_type": "category"},
+    "gtr_link_table": {
+        "id": "str",
+        "project_id": "str",
+        "table_name": "category",
+        "rel": "category",
+    },
+    "gtr_organisations": {"id": "str", "name": "str"},
+    "gtr_organisations_locations": {"id": "str", "country_name": "category"},
+    "crunchbase_organizations": {
+        "id": "str",
+        "name": "str",
+        "country": "category",
+        "country_code": "category",
+        "state_code": "category",
+        "region": "category",
+        "city": "category",
+        "status": "category",
+        "primary_role": "category",
+        "employee_count": "category",
+        "founded_on": "datetime64[ns]",
+        "funding_rounds": "Int64",
+        "num_exits": "Int64",
+        "total_funding_usd": "float64",
+        "short_description": "str",
+        "long_description": "str",
+    },
+    "crunchbase_funding_rounds": {
+        "id": "str",
+        "org_id": "str",
+        "investment_type": "category",
+        "announced_on": "datetime64[ns]",
+        "raised_amount_usd": "float64",
+        "investor_count": "Int64",
+    },
+    "crunchbase_organizations_categories": {
+        "organization_id": "str",
+        "category_name": "category",
+    },
+    "crunchbase_category_groups": {
+        "id": "str",
+        "category_name": "str",
+        "category_group_list": "str",
+    },
+}
+
+# Names we save some tables under
+ALIASES = {
+    "gtr_topics": "gtr_topic",
+    "crunchbase_organisations": "crunchbase_organizations",
+}
+
+
+def get_dtypes(name: str) -> dict:
+    """Declared dtypes of a DAPS table (empty if it has none)
+    Args:
+        name: table name, or the name it is saved under
+    """
+    return DTYPES.get(ALIASES.get(name, name), {})
+
+
+def get_csv_dtypes(name: str) -> dict:
+    """Declared dtypes of a DAPS table that `pd.read_csv` can parse directly"""
+    return {
+        col: dtype
+        for col, dtype in get_dtypes(name).items()
+        if dtype.startswith("datetime") is False
+    }
+
+
+def cast_dtypes(
+    table: pd.DataFrame, dtypes: Dict[str, str], categorical: bool = True
+) -> pd.DataFrame:
+    """Cast the columns of a table to dtypes (see `DTYPES` for the values)
+
+    Columns without a dtype are left as they are.
+
+    Args:
+        table: table (or chunk of a table)
+        dtypes: column to dtype
+        categorical: whether to make categoricals
+    Returns:
+        table with the dtypes
+    """
+    table = table.copy(deep=False)
+    for col, dtype in dtypes.items():
+        if col not in table.columns or str(table[col].dtype) == dtype:
+            continue
+        if dtype.startswith("datetime"):
+            table[col] = pd.to_datetime(table[col], errors="coerce")
+        elif dtype == "str":
+            table[col] = table[col].where(table[col].isnull(), table[col].astype(str))
+        elif dtype != "category" or categorical is True:
+            table[col] = table[col].astype(dtype)
+    return table
+
+
+def apply_schema(
+    table: pd.DataFrame, name: str, categorical: bool = True
+) -> pd.DataFrame:
+    """Cast the columns of a DAPS table to their declared dtypes
+
+    Columns without a declared dtype are left as they are.
+
+    Args:
+        table: table (or chunk of a table)
+        name: table name, or the name it is saved under
+        categorical: whether to make categoricals. Chunks are streamed
+            without them so that they all share the same schema
+    Returns:
+        table with declared dtypes
+    """
+    return cast_dtypes(table, get_dtypes(name), categorical)
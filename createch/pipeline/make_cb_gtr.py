@@ -8,7 +8,7 @@ import pandas as pd
 import requests
 
 from createch import PROJECT_DIR
-from createch.getters.companies_house import get_address, get_sector
+from createch.getters.companies_house import get_company_postcodes, get_latest_sector
 from createch.getters.jacchammer import get_crunchbase, get_gtr
 
 NSPL_PATH = f"{PROJECT_DIR}/inputs/data/nspl"
@@ -52,7 +52,8 @@ def enrich_source(
     """Enrich a source-company table with sector and address info
     Args:
         source: a lookup between source companies and companies house
-        ch_tables: list with company addresses and sectors
+        ch_tables: list with the postcodes and the (first-ranked) sector of
+            companies, see `get_company_postcodes` and `get_latest_sector`
         threshold: threshold for matching
     Returns:
         A df enriched with sector and location (TTWA)
@@ -67,9 +68,7 @@ def enrich_source(
             on="company_number",
             how="inner",
         )
-        .merge(
-            ch_tables[1].query("rank==1")[["company_number", "SIC4_code"]], how="inner"
-        )
+        .merge(ch_tables[1][["company_number", "SIC4_code"]], how="inner")
         .merge(nspl, left_on="postcode", right_on="pcds")
     )
     return enriched
@@ -80,8 +79,8 @@ if __name__ == "__main__":
     fetch_nspl()
 
     logging.info("Getting data")
-    ch_add = get_address()
-    ch_sect = get_sector()
+    ch_add = get_company_postcodes(["company_number", "postcode"])
+    ch_sect = get_latest_sector(["company_number", "SIC4_code"])
 
     logging.info("Enriching data")
     gtr_enr, cb_enr = [
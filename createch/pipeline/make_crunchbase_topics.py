@@ -28,9 +28,7 @@ def make_creative_cat_tokenised(creative_comms, name_comm_lookup):
     ].reset_index(drop=True)
 
     uk_org_cats_id = set(uk_org_cats_ci["organization_id"])
-    ci_tokenised = {
-        k: v for k, v in get_crunchbase_tokenised().items() if k in uk_org_cats_id
-    }
+    ci_tokenised = dict(get_crunchbase_tokenised().subset(uk_org_cats_id).items())
     return ci_tokenised
 
 
@@ -38,9 +36,7 @@ def make_creative_org_tokenised():
     """Lookup of orgs - tokens for orgs in creative sectors"""
 
     cb_ch_creative_ids = set(get_cb_ch_organisations()["cb_id"])
-    ci_tokenised = {
-        k: v for k, v in get_crunchbase_tokenised().items() if k in cb_ch_creative_ids
-    }
+    ci_tokenised = dict(get_crunchbase_tokenised().subset(cb_ch_creative_ids).items())
 
     return ci_tokenised
 
@@ -8,7 +8,7 @@ from createch.getters.gtr import (
     get_cis_lookup,
     get_gtr_projects,
     get_gtr_tokenised,
-    get_link_table,
+    get_link_relation,
     get_organisations,
 )
 from createch.getters.processing import save_model
@@ -21,17 +21,13 @@ def make_creative_tokenised(projects, orgs):
     # creative industries projects"""
 
     logging.info("Merging tables")
-    link_table = get_link_table().query("table_name == 'gtr_organisations'")
-
-    project_org = projects.merge(
-        link_table, left_on="project_id", right_on="project_id"
-    ).merge(orgs, left_on="id", right_on="gtr_id")
-    ci_projects = set(project_org["project_id"])
+    org_projects = get_link_relation("gtr_organisations").links_of_ids(orgs["gtr_id"])
+    ci_projects = set(org_projects["project_id"]) & set(projects["project_id"])
 
     logging.info(len(ci_projects))
 
     logging.info("Getting tokenised")
-    ci_tokenised = {k: v for k, v in get_gtr_tokenised().items() if k in ci_projects}
+    ci_tokenised = dict(get_gtr_tokenised().subset(ci_projects).items())
     return ci_tokenised
 
 
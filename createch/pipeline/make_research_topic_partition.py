@@ -9,6 +9,7 @@ from numpy.random import seed
 
 from createch import PROJECT_DIR
 from createch.getters.daps import get_daps_table
+from createch.getters.gtr import get_link_relation
 from createch.pipeline.network_analysis import make_network_from_coocc
 from createch.utils.io import save_lookup
 
@@ -20,19 +21,16 @@ def make_network_analysis_inputs() -> list:
     gtr_projects = get_daps_table("gtr_projects", GTR_DATA_PATH)[
         ["project_id", "abstractText", "leadFunder"]
     ]
-    gtr_link = (
-        get_daps_table("gtr_link_table", GTR_DATA_PATH)
-        .query("table_name=='gtr_topic'")
-        .reset_index(drop=True)
-    )
-    gtr_categories = get_daps_table("gtr_topic", GTR_DATA_PATH)
-
-    categories_projects = (
-        gtr_categories.merge(gtr_link, on="id")
+    gtr_categories = (
+        get_daps_table("gtr_topic", GTR_DATA_PATH)
         .query("topic_type=='researchTopic'")
-        .query("text!='Unclassified'")[["project_id", "text"]]
-        .reset_index(drop=True)
+        .query("text!='Unclassified'")
     )
+    topic_links = get_link_relation("gtr_topic").links_of_ids(gtr_categories["id"])
+
+    categories_projects = gtr_categories.merge(topic_links, on="id")[
+        ["project_id", "text"]
+    ].reset_index(drop=True)
 
     return gtr_projects, categories_projects
 
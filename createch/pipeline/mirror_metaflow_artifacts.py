@@ -0,0 +1,37 @@
+# Script to mirror the Metaflow artifacts we use to local Parquet, and
+# refresh the views derived from them
+import logging
+
+import createch
+from createch.getters import companies_house, jacchammer
+from createch.getters.metaflow_mirror import mirror_run
+
+FLOWS = createch.config["flows"]
+
+MIRRORED_RUNS = [
+    (
+        companies_house.FLOW_NAME,
+        FLOWS["companies_house"]["run_id"],
+        [
+            "organisation",
+            "organisationaddress",
+            "address",
+            "organisationsector",
+            "organisationname",
+        ],
+    ),
+    (jacchammer.FLOW_NAME, FLOWS["jacchammer"]["gtr"]["run_id"], ["full_top_matches"]),
+    (
+        jacchammer.FLOW_NAME,
+        FLOWS["jacchammer"]["crunchbase"]["run_id"],
+        ["full_top_matches"],
+    ),
+]
+
+if __name__ == "__main__":
+    for flow_name, run_id, artifacts in MIRRORED_RUNS:
+        logging.info(f"Mirroring {flow_name}/{run_id}")
+        mirror_run(flow_name, run_id, artifacts)
+
+    logging.info("Refreshing Companies House views")
+    companies_house.refresh_views()
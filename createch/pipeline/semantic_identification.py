@@ -8,6 +8,7 @@ import numpy as np
 
 from createch import PROJECT_DIR
 from createch.getters.processing import get_model, get_tokenised
+from createch.utils.io import save_lookup
 
 
 with open(f"{PROJECT_DIR}/inputs/data/stop_terms.txt", "r") as infile:
@@ -37,10 +38,7 @@ def save_matches(matched_dict: dict, source: str):
         matched_dict: the lookup
         source: the data source
     """
-    with open(
-        f"{PROJECT_DIR}/outputs/data/{source}/{source}_area_tagged.json", "w"
-    ) as outfile:
-        return json.dump(matched_dict, outfile)
+    save_lookup(matched_dict, f"outputs/data/{source}/{source}_area_tagged")
 
 
 def make_expansions(
@@ -1,15 +1,191 @@
 # Generic read / save functions
 
 import json
+import os
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, Tuple
 
 from createch import PROJECT_DIR
 
+# Keys per statement in batched reads and writes (SQLite allows 999
+# parameters per statement in older versions)
+BATCH_SIZE = 500
+
+
+@contextmanager
+def atomic_write(path: str) -> Iterator[str]:
+    """Temporary path to write a file to, moved to `path` once the block
+    finishes (and removed if it fails), so readers never see a partial file:
+
+        with atomic_write(path) as tmp_path:
+            table.to_parquet(tmp_path)
+
+    The temporary path keeps the extension of `path` (for writers that add
+    one, like `np.save`) and is unique to the process and thread.
+    """
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp-{os.getpid()}-{threading.get_ident()}{ext}"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _batches(iterable: Iterable, size: int = BATCH_SIZE) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class LookupStore(MutableMapping):
+    """Lookup saved in an SQLite key-value table, with JSON-encoded values
+
+    Keys and values are read on demand, so checking a few keys doesn't
+    parse the whole lookup. Writes are batched into transactions. A store can
+    be used from several threads (e.g. by `prefetch`), each with its own
+    connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._cons = []
+        self._lock = threading.Lock()
+        self.con.execute(
+            "CREATE TABLE IF NOT EXISTS lookup (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    @property
+    def con(self) -> sqlite3.Connection:
+        """Connection of the calling thread"""
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # Only used by this thread, but closed by whichever calls `close`
+            con = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self._local.con = con
+            with self._lock:
+                self._cons.append(con)
+        return con
+
+    def __enter__(self) -> "LookupStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for con in self._cons:
+                con.close()
+            self._cons = []
+            self._local = threading.local()
+
+    def __getitem__(self, key: str) -> Any:
+        row = self.con.execute(
+            "SELECT value FROM lookup WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Values of some keys (missing keys are left out)"""
+        values = {}
+        for batch in _batches(keys):
+            rows = self.con.execute(
+                "SELECT key, value FROM lookup WHERE key IN "
+                f"({','.join('?' * len(batch))})",
+                batch,
+            )
+            values.update((key, json.loads(value)) for key, value in rows)
+        return values
+
+    def __setitem__(self, key: str, value: Any):
+        self.update({key: value})
+
+    def __delitem__(self, key: str):
+        with self.con:
+            if self.con.execute("DELETE FROM lookup WHERE key = ?", (key,)).rowcount:
+                return
+        raise KeyError(key)
+
+    def update(self, lookup: Any = (), batch_size: int = BATCH_SIZE):
+        """Write key-value pairs (a mapping or pairs), a batch per transaction"""
+        pairs = lookup.items() if hasattr(lookup, "items") else lookup
+        for batch in _batches(pairs, batch_size):
+            with self.con:
+                self.con.executemany(
+                    "INSERT OR REPLACE INTO lookup VALUES (?, ?)",
+                    [(str(key), json.dumps(value)) for key, value in batch],
+                )
+
+    def __contains__(self, key) -> bool:
+        row = self.con.execute("SELECT 1 FROM lookup WHERE key = ?", (key,))
+        return row.fetchone() is not None
+
+    def __iter__(self) -> Iterator[str]:
+        for (key,) in self.con.execute("SELECT key FROM lookup"):
+            yield key
+
+    def __len__(self) -> int:
+        return self.con.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Key-value pairs, streamed from the table"""
+        for key, value in self.con.execute("SELECT key, value FROM lookup"):
+            yield key, json.loads(value)
+
+
+def _store_path(path_name: str) -> str:
+    return f"{PROJECT_DIR}/{path_name}.sqlite"
+
+
+def _write_store(lookup: Any, path: str):
+    # Replaced as a whole so that keys dropped from the lookup don't linger
+    with atomic_write(path) as tmp_path:
+        with LookupStore(tmp_path) as store:
+            store.update(lookup)
+
 
 def save_lookup(name, path_name):
+    """Saves a lookup as JSON and as a key-value store (see `open_lookup`)"""
     with open(f"{PROJECT_DIR}/{path_name}.json", "w") as outfile:
         json.dump(name, outfile)
 
+    _write_store(name, _store_path(path_name))
+
 
 def get_lookup(path_name):
+    if not os.path.exists(f"{PROJECT_DIR}/{path_name}.json") and os.path.exists(
+        _store_path(path_name)
+    ):
+        with LookupStore(_store_path(path_name)) as store:
+            return dict(store.items())
     with open(f"{PROJECT_DIR}/{path_name}.json", "r") as infile:
         return json.load(infile)
+
+
+def open_lookup(path_name: str) -> LookupStore:
+    """Opens a lookup as a key-value store, for point / batch lookups and
+    streamed iteration without parsing all of it
+
+    Lookups only saved as JSON (or whose JSON is newer than the store) are
+    converted first.
+    """
+    path = _store_path(path_name)
+    json_path = f"{PROJECT_DIR}/{path_name}.json"
+    if not os.path.exists(path) or (
+        os.path.exists(json_path)
+        and os.path.getmtime(json_path) > os.path.getmtime(path)
+    ):
+        _write_store(get_lookup(path_name), path)
+    return LookupStore(path)
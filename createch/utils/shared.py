@@ -0,0 +1,129 @@
+# Share large tables and arrays with worker processes without pickling them
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import weakref
+from functools import lru_cache
+from typing import Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Published files live in memory (tmpfs) where available. Python 3.7 has no
+# `multiprocessing.shared_memory`, so sharing goes through memory-mapped
+# files, which every process maps to the same pages
+SHARED_DIR = os.getenv("CREATECH_SHARED_DIR") or (
+    "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+)
+PREFIX = "createch-shared"
+
+Shareable = Union[pd.DataFrame, np.ndarray]
+
+
+class SharedHandle:
+    """Picklable reference to a published table or array
+
+    Send handles to workers (e.g. as task arguments) and `load` them there.
+    """
+
+    def __init__(self, path: str, kind: str):
+        self.path = path
+        self.kind = kind
+
+    def __repr__(self) -> str:
+        return f"SharedHandle({self.path!r}, {self.kind!r})"
+
+    def load(self) -> Shareable:
+        """The published object, loaded once per process (treat it as
+        read-only, since later loads in the process return the same object)
+
+        Arrays, and DataFrame columns that are numeric without missing
+        values, are read-only views of the mapped file. Other DataFrame
+        columns (e.g. strings) are converted when first loaded.
+        """
+        return _load(self.path, self.kind)
+
+
+@lru_cache(maxsize=32)
+def _load(path: str, kind: str) -> Shareable:
+    if kind == "array":
+        return np.load(path, mmap_mode="r")
+    # The mapping stays open for as long as the table's buffers are used
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def _remove(path: str):
+    shutil.rmtree(path, ignore_errors=True)
+
+
+class SharedStore:
+    """Publishes tables and arrays as memory-mapped files for other processes
+
+    Files are removed when the store is closed (or garbage collected, or the
+    process exits), so use it as a context manager around the parallel work:
+
+        with SharedStore() as shared:
+            topics = shared.publish("topics", get_gtr_topics())
+            pool.map(partial(work, topics=topics), chunks)
+    """
+
+    def __init__(self):
+        cleanup_stale()
+        self.path = tempfile.mkdtemp(prefix=f"{PREFIX}-{os.getpid()}-", dir=SHARED_DIR)
+        self._finalizer = weakref.finalize(self, _remove, self.path)
+        atexit.register(self._finalizer)
+
+    def __enter__(self) -> "SharedStore":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._finalizer()
+
+    def publish(self, name: str, obj: Shareable) -> SharedHandle:
+        """Publish a DataFrame (as an Arrow IPC file) or a numpy array (as a
+        .npy file)
+        Args:
+            name: name of the object, unique in this store
+            obj: DataFrame or array
+        Returns:
+            handle to load the object from in any process
+        """
+        if isinstance(obj, np.ndarray):
+            path = f"{self.path}/{name}.npy"
+            np.save(path, obj)
+            return SharedHandle(path, "array")
+
+        path = f"{self.path}/{name}.arrow"
+        table = pa.Table.from_pandas(obj)
+        with pa.OSFile(path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return SharedHandle(path, "frame")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def cleanup_stale():
+    """Remove stores left behind by processes that died without closing them"""
+    for entry in os.listdir(SHARED_DIR):
+        if not entry.startswith(f"{PREFIX}-"):
+            continue
+        pid = entry[len(PREFIX) + 1 :].split("-")[0]
+        if pid.isdigit() and not _is_alive(int(pid)):
+            logging.info(f"Removing stale shared store {entry}")
+            _remove(f"{SHARED_DIR}/{entry}")
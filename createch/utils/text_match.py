@@ -0,0 +1,65 @@
+# Vectorised matching of keyword lists against text columns
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Pattern, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+@lru_cache(maxsize=64)
+def _compile_terms(terms: Tuple[str, ...]) -> Pattern:
+    # Longest terms first so that the alternation prefers them
+    alternatives = sorted(set(terms), key=len, reverse=True)
+    if not alternatives:
+        return re.compile(r"(?!)")  # Matches nothing
+    return re.compile("|".join(re.escape(term.lower()) for term in alternatives))
+
+
+def terms_pattern(terms: Iterable[str]) -> Pattern:
+    """Single compiled regex matching any of `terms` (lowercased)"""
+    return _compile_terms(tuple(terms))
+
+
+def normalise_text(text: pd.Series) -> pd.Series:
+    """Lowercase a text column, with missing values as empty strings"""
+    return text.fillna("").astype(str).str.lower()
+
+
+def has_terms(text: pd.Series, terms: Iterable[str]) -> pd.Series:
+    """Flag the rows of a text column that contain any of `terms`
+
+    Equivalent to `[any(t in x.lower() for t in terms) for x in text]`, but
+    matched in one pass per row with a compiled regex.
+
+    Args:
+        text: text column (e.g. organisation names)
+        terms: substrings to look for (case-insensitive)
+    Returns:
+        boolean column with the index of `text`
+    """
+    return normalise_text(text).str.contains(terms_pattern(terms), regex=True)
+
+
+def label_terms(
+    text: pd.Series, labels: Dict[str, Iterable[str]], default: Optional[str] = None
+) -> pd.Series:
+    """Label the rows of a text column by the terms they contain
+    Args:
+        text: text column
+        labels: label to the terms that give it. If a row matches several
+            labels, the first one wins
+        default: label of rows that match none
+    Returns:
+        label column with the index of `text`
+    """
+    normalised = normalise_text(text)
+    matches = [
+        normalised.str.contains(terms_pattern(terms), regex=True).to_numpy()
+        for terms in labels.values()
+    ]
+    return pd.Series(
+        np.select(matches, list(labels), default=default) if matches else default,
+        index=text.index,
+        dtype=object,
+    )